@@ -0,0 +1,442 @@
+"""
+NumPy access to appsink samples, e.g. the app branch of the Generator in
+bt08_short_cutting_the_pipeline.py.
+
+Each Gst.Buffer is mapped read-only and wrapped in a NumPy array of the right
+shape, dtype and strides, taken from GstAudio.AudioInfo or GstVideo.VideoInfo
+(and GstVideo.VideoMeta when the buffer carries one). The buffer stays mapped
+for as long as the array, or any view derived from it, is alive: it is
+unmapped by a finalizer once the array is garbage collected.
+
+The data is only shared without a copy when the gst-python overrides are
+installed, since plain PyGObject returns mapped memory as a bytes copy. The
+`zero_copy` field of each sample tells which path was taken.
+
+BatchPuller drains an appsink with `try-pull-sample` on a worker thread, so
+no Python callback runs on the streaming thread, and hands fixed-size batches
+of N samples (or exactly N ms of audio) to user code.
+
+Run this file to compare the reader with `buffer.extract_dup`.
+"""
+
+import collections
+import logging
+import sys
+import threading
+import time
+import weakref
+
+import gi
+import numpy as np
+
+gi.require_version("Gst", "1.0")
+gi.require_version("GstAudio", "1.0")
+gi.require_version("GstVideo", "1.0")
+from gi.repository import Gst, GstAudio, GstVideo
+
+from gst_buffer import is_direct, map_buffer
+
+logger = logging.getLogger(__name__)
+
+ArraySample = collections.namedtuple(
+    "ArraySample", ["array", "pts", "duration", "zero_copy"]
+)
+
+# `samples` is a list of ArraySample, or a single ArraySample holding exactly
+# the requested duration of audio; `fill_time` is the time spent waiting for
+# and pulling its samples, in seconds
+Batch = collections.namedtuple("Batch", ["samples", "fill_time", "dropped"])
+
+# packed video formats: (dtype, components per pixel)
+VIDEO_PACKED_FORMATS = {
+    "GRAY8": (np.uint8, 1),
+    "GRAY16_LE": (np.dtype("<u2"), 1),
+    "GRAY16_BE": (np.dtype(">u2"), 1),
+    "RGB": (np.uint8, 3),
+    "BGR": (np.uint8, 3),
+    "RGBA": (np.uint8, 4),
+    "BGRA": (np.uint8, 4),
+    "ARGB": (np.uint8, 4),
+    "ABGR": (np.uint8, 4),
+    "RGBx": (np.uint8, 4),
+    "BGRx": (np.uint8, 4),
+    "xRGB": (np.uint8, 4),
+    "xBGR": (np.uint8, 4),
+    "YUY2": (np.uint8, 2),
+    "UYVY": (np.uint8, 2),
+}
+
+# planar video formats: per plane (width divisor, height divisor, components)
+VIDEO_PLANAR_FORMATS = {
+    "I420": [(1, 1, 1), (2, 2, 1), (2, 2, 1)],
+    "YV12": [(1, 1, 1), (2, 2, 1), (2, 2, 1)],
+    "Y42B": [(1, 1, 1), (2, 1, 1), (2, 1, 1)],
+    "Y444": [(1, 1, 1), (1, 1, 1), (1, 1, 1)],
+    "NV12": [(1, 1, 1), (2, 2, 2)],
+    "NV21": [(1, 1, 1), (2, 2, 2)],
+}
+
+
+def audio_dtype(format_name):
+    """Maps a GstAudio format name such as 'S16LE' or 'F32LE' to a dtype."""
+    kind = {"S": "i", "U": "u", "F": "f"}.get(format_name[:1])
+    if format_name in ("S8", "U8"):
+        return np.dtype(f"{kind}1")
+    width = format_name[1:3]
+    order = {"LE": "<", "BE": ">"}.get(format_name[-2:])
+    if kind is None or order is None or width not in ("16", "32", "64"):
+        raise ValueError(f"Unsupported audio format '{format_name}'")
+    return np.dtype(f"{order}{kind}{int(width) // 8}")
+
+
+def ceil_div(value, divisor):
+    return -(-value // divisor)
+
+
+class CapsLayout:
+    """Describes how to view a buffer with the given caps as NumPy arrays."""
+
+    def __init__(self, caps):
+        self.caps = caps
+        name = caps.get_structure(0).get_name()
+        if name == "audio/x-raw":
+            self.init_audio(caps)
+        elif name == "video/x-raw":
+            self.init_video(caps)
+        else:
+            raise ValueError(f"Unsupported caps '{name}'")
+
+    def init_audio(self, caps):
+        info = GstAudio.AudioInfo.new_from_caps(caps)
+        self.kind = "audio"
+        self.dtype = audio_dtype(GstAudio.AudioFormat.to_string(info.finfo.format))
+        self.channels = info.channels
+        self.rate = info.rate
+        self.bpf = info.bpf
+        self.interleaved = info.layout == GstAudio.AudioLayout.INTERLEAVED
+
+    def init_video(self, caps):
+        info = GstVideo.VideoInfo.new_from_caps(caps)
+        self.kind = "video"
+        self.format_name = GstVideo.VideoFormat.to_string(info.finfo.format)
+        self.width = info.width
+        self.height = info.height
+        self.offsets = list(info.offset)
+        self.strides = list(info.stride)
+        if self.format_name in VIDEO_PACKED_FORMATS:
+            self.dtype, self.components = VIDEO_PACKED_FORMATS[self.format_name]
+            self.dtype = np.dtype(self.dtype)
+            self.planes = None
+        elif self.format_name in VIDEO_PLANAR_FORMATS:
+            self.dtype = np.dtype(np.uint8)
+            self.planes = VIDEO_PLANAR_FORMATS[self.format_name]
+        else:
+            raise ValueError(f"Unsupported video format '{self.format_name}'")
+
+    def make_array(self, base, buffer):
+        """Returns an array (or a tuple of plane arrays) viewing `base`.
+
+        `base` is a flat uint8 array over the buffer memory; every returned
+        array is a view of it.
+        """
+        if self.kind == "audio":
+            return self.make_audio_array(base)
+        return self.make_video_array(base, buffer)
+
+    def make_audio_array(self, base):
+        n_frames = len(base) // self.bpf
+        array = base[: n_frames * self.bpf].view(self.dtype)
+        if self.interleaved:
+            return array.reshape(n_frames, self.channels)
+        return array.reshape(self.channels, n_frames)
+
+    def make_video_array(self, base, buffer):
+        offsets, strides = self.offsets, self.strides
+        # decoders may lay out planes differently from the caps defaults
+        meta = GstVideo.buffer_get_video_meta(buffer)
+        if meta is not None:
+            offsets, strides = list(meta.offset), list(meta.stride)
+
+        if self.planes is None:
+            return np.ndarray(
+                shape=(self.height, self.width, self.components),
+                dtype=self.dtype,
+                buffer=base,
+                offset=offsets[0],
+                strides=(
+                    strides[0],
+                    self.dtype.itemsize * self.components,
+                    self.dtype.itemsize,
+                ),
+            )
+
+        planes = []
+        for i, (w_div, h_div, components) in enumerate(self.planes):
+            planes.append(
+                np.ndarray(
+                    shape=(
+                        ceil_div(self.height, h_div),
+                        ceil_div(self.width, w_div),
+                        components,
+                    ),
+                    dtype=self.dtype,
+                    buffer=base,
+                    offset=offsets[i],
+                    strides=(strides[i], components, 1),
+                )
+            )
+        return tuple(planes)
+
+
+class AppSinkReader:
+    """Pulls samples from an appsink as NumPy arrays, without copying.
+
+    The caps layout is computed once and reused until the caps change.
+    """
+
+    def __init__(self, app_sink):
+        self.app_sink = app_sink
+        self.layout = None
+        self.warned_copy = False
+
+    def pull(self, timeout=Gst.SECOND):
+        """Returns the next ArraySample, or None on timeout or EOS."""
+        sample = self.app_sink.emit("try-pull-sample", timeout)
+        if sample is None:
+            return None
+        return self.to_array(sample)
+
+    def to_array(self, sample):
+        """Maps `sample` read-only and returns it as an ArraySample."""
+        caps = sample.get_caps()
+        if self.layout is None or not self.layout.caps.is_equal(caps):
+            self.layout = CapsLayout(caps)
+
+        buffer = sample.get_buffer()
+        mapinfo = map_buffer(buffer, Gst.MapFlags.READ)
+        zero_copy = is_direct(mapinfo)
+        base = np.frombuffer(mapinfo.data, dtype=np.uint8)
+        # the buffer is mapped read-only, and so are all views of it
+        base.flags.writeable = False
+        if zero_copy:
+            # every returned array is a view of `base`, so the buffer stays
+            # mapped (and the sample alive) until the last of them is gone
+            weakref.finalize(base, release_mapping, sample, buffer, mapinfo)
+        else:
+            # PyGObject already copied the data, the mapping is not needed
+            buffer.unmap(mapinfo)
+            if not self.warned_copy:
+                logger.warning("gst-python overrides not found, samples are copied")
+                self.warned_copy = True
+
+        array = self.layout.make_array(base, buffer)
+        return ArraySample(array, buffer.pts, buffer.duration, zero_copy)
+
+
+def release_mapping(sample, buffer, mapinfo):
+    buffer.unmap(mapinfo)
+
+
+class BatchPuller:
+    """Pulls appsink samples on a worker thread and delivers them in batches.
+
+    `policy` decides what happens when user code falls behind: "block" lets
+    the appsink queue (`max_buffers` deep) push back on the pipeline, while
+    "drop" makes appsink discard the oldest queued samples. Drops are
+    counted from gaps between consecutive timestamps, which avoids a Python
+    pad probe on the streaming thread.
+
+    With `batch_ms` set on an audio stream, each batch is one ArraySample of
+    exactly that many milliseconds (buffers are split and joined as needed).
+    Otherwise each batch is a list of `batch_size` ArraySamples.
+    """
+
+    def __init__(
+        self,
+        app_sink,
+        on_batch,
+        batch_size=8,
+        batch_ms=None,
+        max_buffers=16,
+        policy="drop",
+        timeout=100 * Gst.MSECOND,
+    ):
+        if policy not in ("block", "drop"):
+            raise ValueError(f"Unknown drop policy '{policy}'")
+
+        self.app_sink = app_sink
+        self.on_batch = on_batch
+        self.batch_size = batch_size
+        self.batch_ms = batch_ms
+        self.timeout = timeout
+        self.reader = AppSinkReader(app_sink)
+
+        # no per-sample signal emission, the worker pulls instead
+        app_sink.set_property("emit-signals", False)
+        app_sink.set_property("max-buffers", max_buffers)
+        app_sink.set_property("drop", policy == "drop")
+
+        self.pending = []
+        self.pending_frames = 0
+        self.fill_start = None
+        self.next_pts = None
+
+        self.batches = 0
+        self.samples = 0
+        self.dropped = 0
+        self.batch_dropped = 0
+        self.fill_time = 0.0
+        self.handler_time = 0.0
+
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.pull_loop, name="appsink-puller")
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        logger.info(f"Batch puller stats: {self.stats()}")
+
+    def pull_loop(self):
+        while not self.stopping.is_set():
+            if self.fill_start is None:
+                self.fill_start = time.perf_counter()
+            item = self.reader.pull(self.timeout)
+            if item is None:
+                if self.app_sink.is_eos():
+                    break
+                continue
+
+            self.samples += 1
+            self.count_drops(item)
+            if self.batch_ms is not None and self.reader.layout.kind == "audio":
+                self.add_audio(item)
+            else:
+                self.pending.append(item)
+                if len(self.pending) >= self.batch_size:
+                    self.deliver(self.pending)
+                    self.pending = []
+
+        # hand over whatever is left at EOS
+        if self.pending:
+            if self.batch_ms is not None and self.reader.layout.kind == "audio":
+                self.deliver(self.join_audio(self.pending_frames))
+            else:
+                self.deliver(self.pending)
+            self.pending = []
+
+    def count_drops(self, item):
+        if item.pts == Gst.CLOCK_TIME_NONE or item.duration == Gst.CLOCK_TIME_NONE:
+            return
+        if self.next_pts is not None and item.duration > 0:
+            gap = item.pts - self.next_pts
+            if gap > item.duration // 2:
+                missing = round(gap / item.duration)
+                self.dropped += missing
+                self.batch_dropped += missing
+        self.next_pts = item.pts + item.duration
+
+    def add_audio(self, item):
+        self.pending.append(item)
+        self.pending_frames += len(item.array)
+        n_frames = int(self.reader.layout.rate * self.batch_ms / 1000)
+        while self.pending_frames >= n_frames:
+            self.deliver(self.join_audio(n_frames))
+
+    def join_audio(self, n_frames):
+        """Returns the first `n_frames` pending frames as one ArraySample."""
+        arrays = [item.array for item in self.pending]
+        joined = np.concatenate(arrays) if len(arrays) > 1 else arrays[0]
+        first = self.pending[0]
+        rate = self.reader.layout.rate
+        batch = ArraySample(
+            joined[:n_frames].copy(),
+            first.pts,
+            Gst.util_uint64_scale(n_frames, Gst.SECOND, rate),
+            False,
+        )
+
+        # keep the remainder, copied so the source buffers can be unmapped
+        rest = joined[n_frames:]
+        self.pending = []
+        self.pending_frames = len(rest)
+        if len(rest):
+            rest_pts = first.pts
+            if first.pts != Gst.CLOCK_TIME_NONE:
+                rest_pts += batch.duration
+            self.pending.append(ArraySample(rest.copy(), rest_pts, 0, False))
+        return batch
+
+    def deliver(self, samples):
+        fill_time = time.perf_counter() - self.fill_start
+        batch = Batch(samples, fill_time, self.batch_dropped)
+        self.batch_dropped = 0
+
+        start = time.perf_counter()
+        self.on_batch(batch)
+        self.handler_time += time.perf_counter() - start
+
+        self.batches += 1
+        self.fill_time += fill_time
+        self.fill_start = time.perf_counter()
+
+    def stats(self):
+        batches = self.batches or 1
+        return {
+            "batches": self.batches,
+            "samples": self.samples,
+            "dropped": self.dropped,
+            "avg_fill_time": self.fill_time / batches,
+            "avg_handler_time": self.handler_time / batches,
+        }
+
+
+def benchmark(n_buffers=300, width=1280, height=720):
+    """Reads RGB frames with AppSinkReader and with `extract_dup`."""
+    description = (
+        f"videotestsrc num-buffers={n_buffers} ! "
+        f"video/x-raw,format=RGB,width={width},height={height} ! "
+        "appsink name=sink sync=false max-buffers=4"
+    )
+    for method in ("extract_dup", "reader"):
+        pipeline = Gst.parse_launch(description)
+        app_sink = pipeline.get_by_name("sink")
+        reader = AppSinkReader(app_sink)
+        pipeline.set_state(Gst.State.PLAYING)
+
+        frames = 0
+        nbytes = 0
+        spent = 0.0
+        while True:
+            sample = app_sink.emit("try-pull-sample", Gst.SECOND)
+            if sample is None:
+                break
+            start = time.perf_counter()
+            if method == "reader":
+                array = reader.to_array(sample).array
+            else:
+                buffer = sample.get_buffer()
+                data = buffer.extract_dup(0, buffer.get_size())
+                array = np.frombuffer(data, dtype=np.uint8).reshape(height, -1)
+            nbytes += array.nbytes
+            del array
+            spent += time.perf_counter() - start
+            frames += 1
+
+        pipeline.set_state(Gst.State.NULL)
+        logger.info(
+            f"{method}: {frames / spent:,.0f} frames/s, "
+            f"{nbytes / spent / 1e9:.2f} GB/s ({frames} frames)"
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    Gst.init(sys.argv)
+    benchmark()
@@ -0,0 +1,439 @@
+"""
+Push-path helpers for feeding appsrc, as done by the Generator in
+bt08_short_cutting_the_pipeline.py.
+
+AppSrcBufferPool hands out preallocated buffers from a Gst.BufferPool, so a
+steady-state feed does not allocate a new Gst.Buffer for every chunk. Buffers
+go back to the pool by themselves once downstream drops its last reference.
+
+ProducerFeed generates buffers on its own thread and pushes them from a
+second one, gated by appsrc's need-data/enough-data signals. This replaces
+the `GLib.idle_add` feed, which spins the main loop until enough-data fires.
+
+ChunkSizer picks the chunk size from a latency target and a push-rate budget,
+and adapts it to how often appsrc runs dry (need-data) or fills up
+(enough-data) and to its queue level.
+
+Run this file to compare pooled pushes with `Gst.Buffer.new_allocate`, and
+the CPU usage of the idle-callback and producer-thread feeds.
+"""
+
+import logging
+import math
+import queue
+import resource
+import sys
+import threading
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+gi.require_version("GstAudio", "1.0")
+from gi.repository import GLib, Gst, GstAudio
+
+from gst_buffer import write_buffer
+from waveform import WaveformSynth
+
+logger = logging.getLogger(__name__)
+
+
+class AppSrcBufferPool:
+    """Preallocated buffers for appsrc pushes, with hit and miss counters.
+
+    A hit is a buffer taken from the pool. A miss happens when the pool is
+    exhausted (every buffer is still queued downstream) or when a chunk is
+    larger than `buffer_size`; the buffer is then allocated as before.
+
+    Every buffer queued anywhere downstream (appsrc, queues, tee branches)
+    keeps its pool buffer, so `max_buffers` has to cover that whole working
+    set, see `in_flight_buffers()`. With `max_buffers=0` the pool grows to
+    the working set once and recycles from then on.
+    """
+
+    def __init__(self, caps, buffer_size, min_buffers=8, max_buffers=0):
+        self.buffer_size = buffer_size
+        self.hits = 0
+        self.misses = 0
+        # number of chunks written in place through a writable mapping
+        self.direct_writes = 0
+
+        self.pool = Gst.BufferPool.new()
+        config = self.pool.get_config()
+        Gst.BufferPool.config_set_params(
+            config, caps, buffer_size, min_buffers, max_buffers
+        )
+        if not self.pool.set_config(config):
+            raise RuntimeError("Could not configure the buffer pool")
+        if not self.pool.set_active(True):
+            raise RuntimeError("Could not activate the buffer pool")
+
+        # never block the caller when the pool is empty, count a miss instead
+        self.acquire_params = Gst.BufferPoolAcquireParams()
+        self.acquire_params.flags = Gst.BufferPoolAcquireFlags.DONTWAIT
+
+    def acquire(self, size):
+        """Returns a writable buffer of `size` bytes."""
+        if size <= self.buffer_size:
+            ret, buffer = self.pool.acquire_buffer(self.acquire_params)
+            if ret == Gst.FlowReturn.OK and buffer:
+                self.hits += 1
+                if size != self.buffer_size:
+                    buffer.set_size(size)
+                return buffer
+
+        self.misses += 1
+        return Gst.Buffer.new_allocate(None, size, None)
+
+    def acquire_filled(self, data):
+        """Returns a buffer holding `data` (bytes or a NumPy array)."""
+        nbytes = memoryview(data).nbytes
+        buffer = self.acquire(nbytes)
+        if write_buffer(buffer, data):
+            self.direct_writes += 1
+        return buffer
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio,
+            "direct_writes": self.direct_writes,
+        }
+
+    def stop(self):
+        """Deactivates the pool. Call after the pipeline went to NULL."""
+        logger.info(f"Buffer pool stats: {self.stats()}")
+        self.pool.set_active(False)
+
+
+def queue_capacity(queue, byte_rate, chunk_size):
+    """Most chunks of `chunk_size` bytes `queue` holds within its limits,
+    None for an unbounded queue."""
+    limits = []
+    if queue.get_property("max-size-buffers"):
+        limits.append(queue.get_property("max-size-buffers"))
+    if queue.get_property("max-size-bytes"):
+        limits.append(math.ceil(queue.get_property("max-size-bytes") / chunk_size))
+    if queue.get_property("max-size-time"):
+        seconds = queue.get_property("max-size-time") / Gst.SECOND
+        limits.append(math.ceil(seconds * byte_rate / chunk_size))
+    return min(limits) if limits else None
+
+
+def in_flight_buffers(max_bytes, queues, byte_rate, chunk_size, margin=16):
+    """Pool size covering the chunks queued in appsrc (`max_bytes`) and in
+    every one of `queues`, plus `margin` for elements holding a few (sinks,
+    adapters). 0 (unbounded) if a queue is unbounded."""
+    total = math.ceil(max_bytes / chunk_size) + margin
+    for queue in queues:
+        capacity = queue_capacity(queue, byte_rate, chunk_size)
+        if capacity is None:
+            return 0
+        total += capacity
+    return total
+
+
+class ChunkSizer:
+    """Chooses appsrc chunk sizes from a latency target and a push budget.
+
+    `target_latency` (seconds) bounds the audio held in one chunk plus the
+    appsrc queue; `max_push_rate` (pushes per second) bounds the number of
+    Python callbacks and pushes per stream. The chunk starts at the smallest
+    size allowed by the budget. Every `interval` seconds it doubles when
+    appsrc keeps running dry with a low queue, and halves again when the
+    queue stays full, always within the latency and budget limits.
+    """
+
+    def __init__(
+        self,
+        byte_rate,
+        frame_size,
+        target_latency=0.1,
+        max_push_rate=50.0,
+        interval=0.5,
+    ):
+        self.byte_rate = byte_rate
+        self.frame_size = frame_size
+        self.target_latency = target_latency
+        self.max_push_rate = max_push_rate
+        self.interval = interval
+
+        # half the latency target for the chunk, the rest for the queue
+        self.max_chunk = self.align(byte_rate * target_latency / 2)
+        self.min_chunk = min(self.align(byte_rate / max_push_rate), self.max_chunk)
+        self.max_queue_bytes = max(
+            self.align(byte_rate * target_latency) - self.max_chunk, self.max_chunk
+        )
+        self.chunk_size = self.min_chunk
+
+        self.pushes = 0
+        self.need_data = 0
+        self.enough_data = 0
+        self.level_bytes = 0
+        self.push_rate = 0.0
+        self.need_data_rate = 0.0
+        self.enough_data_rate = 0.0
+        self.window_start = time.monotonic()
+
+    def align(self, nbytes):
+        """Rounds down to whole frames, keeping at least one frame."""
+        return max(self.frame_size, int(nbytes) // self.frame_size * self.frame_size)
+
+    def record_need_data(self):
+        self.need_data += 1
+
+    def record_enough_data(self):
+        self.enough_data += 1
+
+    def record_push(self, app_source):
+        """Counts a push and re-evaluates the chunk size once per interval."""
+        self.pushes += 1
+        now = time.monotonic()
+        elapsed = now - self.window_start
+        if elapsed < self.interval:
+            return
+
+        self.push_rate = self.pushes / elapsed
+        self.need_data_rate = self.need_data / elapsed
+        self.enough_data_rate = self.enough_data / elapsed
+        self.level_bytes = app_source.get_property("current-level-bytes")
+        self.pushes = self.need_data = self.enough_data = 0
+        self.window_start = now
+
+        fill = self.level_bytes / self.max_queue_bytes
+        old_size = self.chunk_size
+        if self.need_data_rate > 0 and self.enough_data_rate == 0 and fill < 0.25:
+            # appsrc keeps draining: fewer, larger pushes
+            self.chunk_size = min(self.chunk_size * 2, self.max_chunk)
+        elif self.enough_data_rate > 0 and fill > 0.75:
+            # we keep up easily: smaller chunks lower the latency
+            self.chunk_size = max(self.align(self.chunk_size // 2), self.min_chunk)
+
+        if self.chunk_size != old_size:
+            logger.info(
+                f"Chunk size {old_size} -> {self.chunk_size} bytes "
+                f"(push rate {self.push_rate:.1f}/s, queue {fill:.0%})"
+            )
+
+    def metrics(self):
+        return {
+            "chunk_size": self.chunk_size,
+            "chunk_latency": self.chunk_size / self.byte_rate,
+            "push_rate": self.push_rate,
+            "need_data_rate": self.need_data_rate,
+            "enough_data_rate": self.enough_data_rate,
+            "level_bytes": self.level_bytes,
+        }
+
+
+class ProducerFeed:
+    """Feeds appsrc from dedicated threads through a bounded queue.
+
+    The producer thread calls `make_buffer()` and keeps up to `max_queued`
+    buffers ready. The pusher thread moves them into appsrc while appsrc asks
+    for data, i.e. between `resume()` (need-data) and `pause()` (enough-data).
+    Both threads sleep otherwise, so the main loop only handles control.
+    """
+
+    def __init__(self, app_source, make_buffer, max_queued=8):
+        self.app_source = app_source
+        self.make_buffer = make_buffer
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.need_data = threading.Event()
+        self.stopping = threading.Event()
+        self.last_flow = Gst.FlowReturn.OK
+        self.threads = [
+            threading.Thread(target=self.produce_loop, name="appsrc-producer"),
+            threading.Thread(target=self.push_loop, name="appsrc-pusher"),
+        ]
+
+    def start(self):
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def resume(self):
+        """Call from the need-data handler."""
+        self.need_data.set()
+
+    def pause(self):
+        """Call from the enough-data handler."""
+        self.need_data.clear()
+
+    def produce_loop(self):
+        while not self.stopping.is_set():
+            buffer = self.make_buffer()
+            # a full queue blocks here, so generation never runs far ahead
+            while not self.stopping.is_set():
+                try:
+                    self.queue.put(buffer, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    def push_loop(self):
+        while not self.stopping.is_set():
+            if not self.need_data.wait(timeout=0.1):
+                continue
+            try:
+                buffer = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            self.last_flow = self.app_source.emit("push-buffer", buffer)
+            if self.last_flow != Gst.FlowReturn.OK:
+                logger.info(f"Producer feed stopped: {self.last_flow}")
+                self.stopping.set()
+
+    def stop(self):
+        self.stopping.set()
+        for thread in self.threads:
+            if thread.is_alive():
+                thread.join()
+
+
+def benchmark(n_buffers=20000, chunk_size=1024, sample_rate=44100):
+    """Pushes silence through appsrc ! queue ! fakesink with and without a
+    pool."""
+    info = GstAudio.AudioInfo()
+    info.set_format(GstAudio.AudioFormat.S16, sample_rate, 1, None)
+    caps = info.to_caps()
+    data = bytes(chunk_size)
+    n_samples = chunk_size // 2
+
+    for pooled in (False, True):
+        pipeline = Gst.parse_launch(
+            "appsrc name=src ! queue name=queue ! fakesink sync=false"
+        )
+        src = pipeline.get_by_name("src")
+        src.set_property("caps", caps)
+        src.set_property("format", Gst.Format.TIME)
+        src.set_property("max-bytes", chunk_size * 16)
+        src.set_property("block", True)
+        pipeline.set_state(Gst.State.PLAYING)
+        pool = None
+        if pooled:
+            # size the pool for everything appsrc and the queue can hold
+            max_buffers = in_flight_buffers(
+                chunk_size * 16,
+                [pipeline.get_by_name("queue")],
+                sample_rate * 2,
+                chunk_size,
+            )
+            pool = AppSrcBufferPool(caps, chunk_size, max_buffers=max_buffers)
+
+        start = time.perf_counter()
+        for i in range(n_buffers):
+            if pool:
+                buffer = pool.acquire_filled(data)
+            else:
+                buffer = Gst.Buffer.new_allocate(None, chunk_size, None)
+                buffer.fill(0, data)
+            buffer.pts = Gst.util_uint64_scale(i * n_samples, Gst.SECOND, sample_rate)
+            buffer.duration = Gst.util_uint64_scale(n_samples, Gst.SECOND, sample_rate)
+            src.emit("push-buffer", buffer)
+        src.emit("end-of-stream")
+        pipeline.get_bus().timed_pop_filtered(
+            Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR
+        )
+        elapsed = time.perf_counter() - start
+        pipeline.set_state(Gst.State.NULL)
+
+        label = "pooled" if pooled else "new_allocate"
+        logger.info(f"{label}: {n_buffers / elapsed:,.0f} buffers/s")
+        if pool:
+            pool.stop()
+
+
+def benchmark_feed_modes(seconds=5.0, chunk_size=1024, sample_rate=44100):
+    """Compares CPU usage of the idle-callback and producer-thread feeds.
+
+    The pipeline syncs to the clock, so both modes produce realtime audio and
+    any difference in CPU time is feed overhead.
+    """
+    info = GstAudio.AudioInfo()
+    info.set_format(GstAudio.AudioFormat.S16, sample_rate, 1, None)
+    caps = info.to_caps()
+    n_samples = chunk_size // 2
+
+    for mode in ("idle", "thread"):
+        pipeline = Gst.parse_launch("appsrc name=src ! fakesink sync=true")
+        src = pipeline.get_by_name("src")
+        src.set_property("caps", caps)
+        src.set_property("format", Gst.Format.TIME)
+        synth = WaveformSynth(block_size=n_samples)
+        pool = AppSrcBufferPool(caps, chunk_size)
+        loop = GLib.MainLoop()
+        state = {"num_samples": 0, "sourceid": None}
+
+        def make_buffer():
+            buffer = pool.acquire_filled(synth.next_block())
+            buffer.pts = Gst.util_uint64_scale(
+                state["num_samples"], Gst.SECOND, sample_rate
+            )
+            buffer.duration = Gst.util_uint64_scale(n_samples, Gst.SECOND, sample_rate)
+            state["num_samples"] += n_samples
+            return buffer
+
+        def push_data(_):
+            ret = src.emit("push-buffer", make_buffer())
+            return ret == Gst.FlowReturn.OK
+
+        def start_feed(src, size):
+            if state["sourceid"] is None:
+                state["sourceid"] = GLib.idle_add(push_data, None)
+
+        def stop_feed(src):
+            if state["sourceid"] is not None:
+                GLib.source_remove(state["sourceid"])
+                state["sourceid"] = None
+
+        producer = None
+        if mode == "thread":
+            producer = ProducerFeed(src, make_buffer)
+            src.connect("need-data", lambda src, size: producer.resume())
+            src.connect("enough-data", lambda src: producer.pause())
+            producer.start()
+        else:
+            # need-data is emitted from the streaming thread, so only hand
+            # the callback over to the main loop, like bt08 does
+            src.connect("need-data", start_feed)
+            src.connect("enough-data", stop_feed)
+
+        GLib.timeout_add(int(seconds * 1000), loop.quit)
+        cpu_start = time.process_time()
+        main_start = resource.getrusage(resource.RUSAGE_THREAD)
+        pipeline.set_state(Gst.State.PLAYING)
+        loop.run()
+        main_end = resource.getrusage(resource.RUSAGE_THREAD)
+        cpu = time.process_time() - cpu_start
+        main_cpu = (main_end.ru_utime + main_end.ru_stime) - (
+            main_start.ru_utime + main_start.ru_stime
+        )
+
+        if producer:
+            producer.stop()
+        stop_feed(src)
+        pipeline.set_state(Gst.State.NULL)
+        pool.stop()
+
+        logger.info(
+            f"{mode} feed: process CPU {100 * cpu / seconds:.1f}%, "
+            f"main loop thread CPU {100 * main_cpu / seconds:.1f}% "
+            f"({state['num_samples']} samples in {seconds:.1f}s)"
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    Gst.init(sys.argv)
+    benchmark()
+    benchmark_feed_modes()
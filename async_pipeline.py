@@ -0,0 +1,239 @@
+"""
+asyncio integration for GStreamer pipelines.
+
+The tutorials each wait on the bus their own way: bt03 blocks in
+`timed_pop_filtered` (with a `time.sleep` fallback), bt04, bt06 and bt07 poll
+every 100-500 ms, and bt05, bt08 and bt12 run a GLib main loop. AsyncPipeline
+instead registers the bus file descriptor (`Gst.Bus.get_pollfd`) with the
+asyncio event loop, so a single loop can drive many pipelines without a
+thread or a poll loop per pipeline. It offers:
+
+- bus messages as an async iterator,
+- awaitable state changes and EOS,
+- appsink samples as an async iterator.
+
+Run this file to play many test pipelines concurrently from one event loop.
+"""
+
+import asyncio
+import logging
+import sys
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineError(Exception):
+    """An ERROR message was posted on the bus, or a state change failed."""
+
+
+def error_from_message(msg):
+    err, debug_info = msg.parse_error()
+    return PipelineError(
+        f"Error received from element {msg.src.get_name()}: {err.message}"
+        f" ({debug_info if debug_info else 'no debug info'})"
+    )
+
+
+class AsyncPipeline:
+    """Drives a Gst.Pipeline from an asyncio event loop.
+
+    Must be created from a coroutine running on that loop (or be given the
+    loop). Call `close()` when done, it also sets the pipeline to NULL.
+    """
+
+    def __init__(self, pipeline, loop=None):
+        self.pipeline = pipeline
+        self.loop = loop or asyncio.get_running_loop()
+        self.bus = pipeline.get_bus()
+        self.subscribers = []
+        self.waiters = []
+        self.eos = False
+        self.error = None
+
+        # the bus fd becomes readable whenever a message is queued
+        self.fd = self.bus.get_pollfd().fd
+        self.loop.add_reader(self.fd, self.on_bus_readable)
+
+    def on_bus_readable(self):
+        while True:
+            msg = self.bus.pop()
+            if msg is None:
+                break
+            self.dispatch(msg)
+
+    def dispatch(self, msg):
+        if msg.type == Gst.MessageType.ERROR:
+            self.error = error_from_message(msg)
+        elif msg.type == Gst.MessageType.EOS:
+            self.eos = True
+
+        for msg_types, queue in self.subscribers:
+            if msg.type & msg_types:
+                queue.put_nowait(msg)
+
+        for waiter in list(self.waiters):
+            predicate, future = waiter
+            if future.done():
+                self.waiters.remove(waiter)
+            elif msg.type == Gst.MessageType.ERROR:
+                future.set_exception(self.error)
+                self.waiters.remove(waiter)
+            elif predicate(msg):
+                future.set_result(msg)
+                self.waiters.remove(waiter)
+
+    async def messages(self, msg_types=Gst.MessageType.ANY):
+        """Yields bus messages of `msg_types` until EOS or an error."""
+        queue = asyncio.Queue()
+        subscriber = (msg_types | Gst.MessageType.EOS | Gst.MessageType.ERROR, queue)
+        self.subscribers.append(subscriber)
+        try:
+            while True:
+                msg = await queue.get()
+                if msg.type & msg_types:
+                    yield msg
+                if msg.type in (Gst.MessageType.EOS, Gst.MessageType.ERROR):
+                    break
+        finally:
+            self.subscribers.remove(subscriber)
+
+    def wait_for(self, predicate):
+        """Returns a future resolved with the first message matching
+        `predicate`, or failed with PipelineError on an ERROR message."""
+        future = self.loop.create_future()
+        if self.error is not None:
+            future.set_exception(self.error)
+        else:
+            self.waiters.append((predicate, future))
+        return future
+
+    async def set_state(self, state, timeout=None):
+        """Changes the pipeline state and waits until it is reached."""
+
+        def reached(msg):
+            if msg.type != Gst.MessageType.STATE_CHANGED or msg.src != self.pipeline:
+                return False
+            old, new, pending = msg.parse_state_changed()
+            return new == state and pending == Gst.State.VOID_PENDING
+
+        # subscribe before changing state so the message cannot be missed
+        future = self.wait_for(reached)
+        ret = self.pipeline.set_state(state)
+        if ret == Gst.StateChangeReturn.FAILURE:
+            future.cancel()
+            raise PipelineError(
+                "Unable to set the pipeline to the "
+                f"{Gst.Element.state_get_name(state)} state"
+            )
+        current = self.pipeline.get_state(0)[1]
+        if current == state or ret == Gst.StateChangeReturn.NO_PREROLL:
+            future.cancel()
+            return ret
+        await asyncio.wait_for(future, timeout)
+        return ret
+
+    async def wait_eos(self, timeout=None):
+        """Waits for EOS, raising PipelineError if an error comes first."""
+        if self.eos:
+            return
+        await asyncio.wait_for(
+            self.wait_for(lambda msg: msg.type == Gst.MessageType.EOS), timeout
+        )
+
+    def samples(self, app_sink, max_queued=32):
+        """Returns an async iterator over the samples of `app_sink` until EOS.
+
+        Samples are pulled on the streaming thread in the new-sample handler
+        and handed to the event loop. If the consumer falls behind by more
+        than `max_queued` samples, the oldest ones are dropped. The handlers
+        are connected right away, so call this before starting the pipeline.
+        """
+        queue = asyncio.Queue(maxsize=max_queued)
+
+        def put(sample):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(sample)
+
+        def on_new_sample(sink):
+            sample = sink.emit("pull-sample")
+            if sample is None:
+                return Gst.FlowReturn.EOS
+            self.loop.call_soon_threadsafe(put, sample)
+            return Gst.FlowReturn.OK
+
+        def on_eos(sink):
+            self.loop.call_soon_threadsafe(put, None)
+
+        app_sink.set_property("emit-signals", True)
+        handlers = [
+            app_sink.connect("new-sample", on_new_sample),
+            app_sink.connect("eos", on_eos),
+        ]
+        return self.iterate_samples(app_sink, queue, handlers)
+
+    async def iterate_samples(self, app_sink, queue, handlers):
+        try:
+            while True:
+                sample = await queue.get()
+                if sample is None:
+                    break
+                yield sample
+        finally:
+            for handler in handlers:
+                app_sink.disconnect(handler)
+
+    def close(self):
+        self.loop.remove_reader(self.fd)
+        self.pipeline.set_state(Gst.State.NULL)
+        for predicate, future in self.waiters:
+            future.cancel()
+        self.waiters = []
+
+
+async def run_until_eos(pipeline):
+    """Plays `pipeline` until EOS, raising PipelineError on errors."""
+    runner = AsyncPipeline(pipeline)
+    try:
+        await runner.set_state(Gst.State.PLAYING)
+        await runner.wait_eos()
+    finally:
+        runner.close()
+
+
+async def demo(n_pipelines=200, num_buffers=100):
+    description = f"videotestsrc num-buffers={num_buffers} ! fakesink sync=false"
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(run_until_eos(Gst.parse_launch(description)) for _ in range(n_pipelines))
+    )
+    elapsed = time.perf_counter() - start
+    logger.info(f"Ran {n_pipelines} pipelines to EOS in {elapsed:.2f}s")
+
+    pipeline = Gst.parse_launch(
+        "audiotestsrc num-buffers=20 ! appsink name=sink sync=false"
+    )
+    runner = AsyncPipeline(pipeline)
+    try:
+        samples = runner.samples(pipeline.get_by_name("sink"))
+        await runner.set_state(Gst.State.PLAYING)
+        count = 0
+        async for sample in samples:
+            count += 1
+        logger.info(f"Received {count} appsink samples")
+    finally:
+        runner.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    Gst.init(sys.argv)
+    asyncio.run(demo())
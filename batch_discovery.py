@@ -0,0 +1,212 @@
+"""
+Concurrent batch discovery with JSONL output.
+
+`DiscovererApp` in bt09_media_information_gathering.py discovers one URI and
+runs a main loop for it. For a whole media library, `discover_batch()` runs
+a pool of discoverers instead, one per worker thread or process, each in
+synchronous mode with its own per-file timeout, so a slow or broken file
+only ever holds up one worker. Results are yielded (and written as JSON
+lines) as soon as each file is done, in completion order.
+
+    python batch_discovery.py /app/videos --workers 8 --output library.jsonl
+    python batch_discovery.py --from-file uris.txt --processes
+"""
+
+import argparse
+import concurrent.futures
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+gi.require_version("GstPbutils", "1.0")
+from gi.repository import GLib, Gst, GstPbutils
+
+from media_info import taglist_to_dict
+
+logger = logging.getLogger(__name__)
+
+RESULTS = {
+    GstPbutils.DiscovererResult.OK: "ok",
+    GstPbutils.DiscovererResult.URI_INVALID: "uri-invalid",
+    GstPbutils.DiscovererResult.ERROR: "error",
+    GstPbutils.DiscovererResult.TIMEOUT: "timeout",
+    GstPbutils.DiscovererResult.BUSY: "busy",
+    GstPbutils.DiscovererResult.MISSING_PLUGINS: "missing-plugins",
+}
+
+
+def stream_to_dict(sinfo):
+    """The stream topology walked by `print_topology` in bt09, as a dict."""
+    caps = sinfo.get_caps()
+    description = ""
+    if caps:
+        if caps.is_fixed():
+            description = GstPbutils.pb_utils_get_codec_description(caps)
+        else:
+            description = caps.to_string()
+    tags = sinfo.get_tags()
+    stream = {
+        "type": sinfo.get_stream_type_nick(),
+        "caps": caps.to_string() if caps else None,
+        "description": description,
+        "tags": taglist_to_dict(tags) if tags else None,
+        "children": [],
+    }
+    next_info = sinfo.get_next()
+    if next_info:
+        stream["children"].append(stream_to_dict(next_info))
+    elif isinstance(sinfo, GstPbutils.DiscovererContainerInfo):
+        for child in sinfo.get_streams() or []:
+            stream["children"].append(stream_to_dict(child))
+    return stream
+
+
+def info_to_dict(info):
+    result = info.get_result()
+    record = {
+        "uri": info.get_uri(),
+        "result": RESULTS.get(result, "unknown"),
+    }
+    if result != GstPbutils.DiscovererResult.OK:
+        misc = info.get_misc()
+        record["error"] = misc.to_string() if misc else None
+        return record
+
+    tags = info.get_tags()
+    sinfo = info.get_stream_info()
+    record.update(
+        duration=info.get_duration(),
+        seekable=info.get_seekable(),
+        live=info.get_live(),
+        tags=taglist_to_dict(tags) if tags else None,
+        streams=stream_to_dict(sinfo) if sinfo else None,
+    )
+    return record
+
+
+# one discoverer per worker thread (and so per worker process)
+local = threading.local()
+
+
+def discover(uri, timeout):
+    """Discovers `uri` synchronously and returns its record."""
+    discoverer = getattr(local, "discoverer", None)
+    if discoverer is None:
+        Gst.init(None)
+        discoverer = local.discoverer = GstPbutils.Discoverer.new(timeout)
+
+    start = time.perf_counter()
+    try:
+        record = info_to_dict(discoverer.discover_uri(uri))
+    except GLib.Error as err:
+        # discover_uri raises for everything but OK, the info is lost
+        record = {"uri": uri, "result": "error", "error": err.message}
+    record["elapsed"] = time.perf_counter() - start
+    if record["result"] == "error" and record["elapsed"] * Gst.SECOND >= timeout:
+        record["result"] = "timeout"
+    return record
+
+
+def iter_uris(sources, from_file=None):
+    """URIs from directories (walked recursively), files and URIs, and
+    from a list file with one path or URI per line ("-" for stdin)."""
+    if from_file:
+        lines = sys.stdin if from_file == "-" else open(from_file)
+        sources = list(sources) + [line.strip() for line in lines if line.strip()]
+    for source in sources:
+        if Gst.uri_is_valid(source):
+            yield source
+        elif os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    yield Gst.filename_to_uri(os.path.join(root, name))
+        else:
+            yield Gst.filename_to_uri(os.path.abspath(source))
+
+
+def discover_batch(
+    uris, workers=4, processes=False, timeout=5 * Gst.SECOND, probe=discover
+):
+    """Yields a record per URI as soon as it is discovered by
+    `probe(uri, timeout)`, a module-level function (or partial of one)."""
+    if processes:
+        # spawn: forking a process that already runs GStreamer threads is
+        # unsafe
+        executor = concurrent.futures.ProcessPoolExecutor(
+            workers, multiprocessing.get_context("spawn")
+        )
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(workers)
+
+    with executor:
+        # keep a bounded number of files in flight so huge libraries do not
+        # queue millions of futures up front
+        pending = set()
+        uris = iter(uris)
+        while True:
+            for uri in uris:
+                pending.add(executor.submit(probe, uri, timeout))
+                if len(pending) >= 4 * workers:
+                    break
+            if not pending:
+                return
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                yield future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("sources", nargs="*", help="directories, files or URIs")
+    parser.add_argument("--from-file", help="file with one path or URI per line")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--processes", action="store_true")
+    parser.add_argument("--timeout", type=float, default=5.0, help="seconds per file")
+    parser.add_argument("--output", help="JSONL file (default: stdout)")
+    args = parser.parse_args()
+
+    Gst.init(None)
+    output = open(args.output, "w") if args.output else sys.stdout
+    start = time.perf_counter()
+    count = 0
+    failed = 0
+    records = discover_batch(
+        iter_uris(args.sources, args.from_file),
+        args.workers,
+        args.processes,
+        int(args.timeout * Gst.SECOND),
+    )
+    for record in records:
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+        count += 1
+        failed += record["result"] != "ok"
+        if count % 100 == 0:
+            elapsed = time.perf_counter() - start
+            logger.info(f"{count} files, {count / elapsed:.1f} files/s")
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Discovered {count} files ({failed} failed) in {elapsed:.2f}s, "
+        f"{count / elapsed if elapsed else 0:.1f} files/s"
+    )
+    if output is not sys.stdout:
+        output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    sys.exit(main())
@@ -23,6 +23,12 @@ gi.require_version("GstVideo", "1.0")
 # must import GdkX11 and GstVideo to get the correct window handler
 from gi.repository import GdkX11, GLib, Gst, GstVideo, Gtk
 
+from seek_coalescer import SeekCoalescer
+from stream_tags import StreamTagModel
+
+# stream kinds in the order they are listed, with their titles
+STREAM_TITLES = {"video": "video", "audio": "audio", "text": "subtitle"}
+
 
 class Player(object):
 
@@ -35,6 +41,8 @@ class Player(object):
 
         self.state = Gst.State.NULL
         self.duration = Gst.CLOCK_TIME_NONE
+        # is the slider being dragged?
+        self.scrubbing = False
         self.playbin = Gst.ElementFactory.make("playbin", "playbin")
 
         # set up URI
@@ -44,10 +52,13 @@ class Player(object):
             # "uri", "https://gstreamer.freedesktop.org/data/media/sintel_trailer-480p.webm"
         )
 
-        # connect to interesting signals in playbin
-        self.playbin.connect("video-tags-changed", self.on_tags_changed)
-        self.playbin.connect("audio-tags-changed", self.on_tags_changed)
-        self.playbin.connect("text-tags-changed", self.on_tags_changed)
+        # start of each stream's text in the streams widget, by (kind, index)
+        self.stream_marks = {}
+
+        # follow the *-tags-changed signals of playbin. bursts of tag updates
+        # are coalesced and analyze_streams is only called when a shown value
+        # changed
+        self.stream_tags = StreamTagModel(self.playbin, self.analyze_streams)
 
         # create the GUI
         self.build_ui()
@@ -59,7 +70,9 @@ class Player(object):
         bus.connect("message::error", self.on_error)
         bus.connect("message::eos", self.on_eos)
         bus.connect("message::state-changed", self.on_state_changed)
-        bus.connect("message::application", self.on_application_message)
+
+        # sends at most one seek at a time, the latest requested one
+        self.seeker = SeekCoalescer(self.playbin)
 
     # set the playbin to PLAYING (start playback), register refresh callback
     # and start the GTK main loop
@@ -82,6 +95,8 @@ class Player(object):
 
     # set the playbin state to NULL and remove the reference to it
     def cleanup(self):
+        logger.info(f"Seek statistics: {self.seeker.stats()}")
+        logger.info(f"Tag statistics: {self.stream_tags.stats()}")
         if self.playbin:
             self.playbin.set_state(Gst.State.NULL)
             self.playbin = None
@@ -109,6 +124,8 @@ class Player(object):
         self.slider_update_signal_id = self.slider.connect(
             "value-changed", self.on_slider_changed
         )
+        self.slider.connect("button-press-event", self.on_slider_pressed)
+        self.slider.connect("button-release-event", self.on_slider_released)
 
         self.streams_list = Gtk.TextView.new()
         self.streams_list.set_editable(False)
@@ -175,14 +192,24 @@ class Player(object):
         return False
 
     # this function is called when the slider changes its position.
-    # we perform a seek to the new position here
+    # we request a seek to the new position here: fast keyframe seeks while
+    # the slider is dragged, an accurate one otherwise (e.g. keyboard)
     def on_slider_changed(self, range):
         value = self.slider.get_value()
-        self.playbin.seek_simple(
-            Gst.Format.TIME,
-            Gst.SeekFlags.FLUSH | Gst.SeekFlags.KEY_UNIT,
-            value * Gst.SECOND,
-        )
+        if self.scrubbing:
+            self.seeker.scrub(value * Gst.SECOND)
+        else:
+            self.seeker.release(value * Gst.SECOND)
+
+    def on_slider_pressed(self, widget, event):
+        self.scrubbing = True
+        return False
+
+    # the drag is over, land exactly where the slider was released
+    def on_slider_released(self, widget, event):
+        self.scrubbing = False
+        self.seeker.release(self.slider.get_value() * Gst.SECOND)
+        return False
 
     # this function is called periodically to refresh the GUI
     def refresh_ui(self):
@@ -202,6 +229,10 @@ class Player(object):
                 # set the range of the slider to the clip duration (in seconds)
                 self.slider.set_range(0, self.duration / Gst.SECOND)
 
+        # do not move the slider under the user's pointer
+        if self.scrubbing:
+            return True
+
         ret, current = self.playbin.query_position(Gst.Format.TIME)
         if ret:
             # block the "value-changed" signal, so the on_slider_changed
@@ -218,16 +249,6 @@ class Player(object):
 
         return True
 
-    # this function is called when new metadata is discovered in the stream
-    def on_tags_changed(self, playbin, stream):
-        # we are possibly in a GStreamer working thread, so we notify
-        # the main thread of this event through a message in the bus
-        self.playbin.post_message(
-            Gst.Message.new_application(
-                self.playbin, Gst.Structure.new_empty("tags-changed")
-            )
-        )
-
     # this function is called when an error message is posted on the bus
     def on_error(self, bus, msg):
         err, dbg = msg.parse_error()
@@ -259,62 +280,64 @@ class Player(object):
             # we reach the PAUSED state
             self.refresh_ui()
 
-    # extract metadata from all the streams and write it to the text widget
-    # in the GUI
-    def analyze_streams(self):
-        # clear current contents of the widget
+    # text shown for one stream. video streams always show their codec,
+    # "unknown" when there is no codec tag
+    def stream_text(self, key, info):
+        kind, i = key
+        if kind == "video":
+            info = {"codec": None, **info}
+        text = f"{STREAM_TITLES[kind]} stream {i}\n"
+        for label, value in info.items():
+            text += f"  {label}: {value or 'unknown'}\n"
+        return text + "\n"
+
+    # update the text of the streams whose metadata changed in the text
+    # widget of the GUI. called on the main loop by the StreamTagModel, which
+    # already read the tags. every stream's text starts at a mark and ends at
+    # the mark of the next stream, so the other streams are left untouched
+    def analyze_streams(self, changed):
         buffer = self.streams_list.get_buffer()
-        buffer.set_text("")
-
-        # read some properties
-        nr_video = self.playbin.get_property("n-video")
-        nr_audio = self.playbin.get_property("n-audio")
-        nr_text = self.playbin.get_property("n-text")
-
-        for i in range(nr_video):
-            tags = None
-            # retrieve the stream's video tags
-            tags = self.playbin.emit("get-video-tags", i)
-            if tags:
-                buffer.insert_at_cursor(f"video stream {i}\n")
-                _, str = tags.get_string(Gst.TAG_VIDEO_CODEC)
-                buffer.insert_at_cursor(f"  codec: {str or 'unknown'}\n")
-
-        for i in range(nr_audio):
-            tags = None
-            # retrieve the stream's audio tags
-            tags = self.playbin.emit("get-audio-tags", i)
-            if tags:
-                buffer.insert_at_cursor(f"\naudio stream {i}\n")
-                ret, str = tags.get_string(Gst.TAG_AUDIO_CODEC)
-                if ret:
-                    buffer.insert_at_cursor(f"  codec: {str or 'unknown'}\n")
-
-                ret, str = tags.get_string(Gst.TAG_LANGUAGE_CODE)
-                if ret:
-                    buffer.insert_at_cursor(f"  language: {str or 'unknown'}\n")
-
-                ret, str = tags.get_uint(Gst.TAG_BITRATE)
-                if ret:
-                    buffer.insert_at_cursor(f"  bitrate: {str or 'unknown'}\n")
-
-        for i in range(nr_text):
-            tags = None
-            # retrieve the stream's subtitle tags
-            tags = self.playbin.emit("get-text-tags", i)
-            if tags:
-                buffer.insert_at_cursor(f"\nsubtitle stream {i}\n")
-                ret, str = tags.get_string(Gst.TAG_LANGUAGE_CODE)
-                if ret:
-                    buffer.insert_at_cursor(f"  language: {str or 'unknown'}\n")
-
-    # this function is called when an "application" message is posted on the bus
-    # here we retrieve the message posted by the on_tags_changed callback
-    def on_application_message(self, bus, msg):
-        if msg.get_structure().get_name() == "tags-changed":
-            # if the message is the "tags-changed", update the stream info in
-            # the GUI
-            self.analyze_streams()
+        kinds = list(STREAM_TITLES)
+
+        def order(key):
+            return kinds.index(key[0]), key[1]
+
+        for key in sorted(changed, key=order):
+            info = self.stream_tags.streams.get(key)
+            mark = self.stream_marks.get(key)
+            following = sorted(
+                (other for other in self.stream_marks if order(other) > order(key)),
+                key=order,
+            )
+            next_mark = self.stream_marks[following[0]] if following else None
+
+            def next_iter():
+                if next_mark is None:
+                    return buffer.get_end_iter()
+                return buffer.get_iter_at_mark(next_mark)
+
+            if mark is not None:
+                buffer.delete(buffer.get_iter_at_mark(mark), next_iter())
+            if info is None:
+                # the stream has no tags (anymore)
+                if mark is not None:
+                    buffer.delete_mark(mark)
+                    del self.stream_marks[key]
+                continue
+
+            position = buffer.get_iter_at_mark(mark) if mark else next_iter()
+            offset = position.get_offset()
+            text = self.stream_text(key, info)
+            buffer.insert(position, text)
+            if mark is None:
+                self.stream_marks[key] = buffer.create_mark(
+                    None, buffer.get_iter_at_offset(offset), True
+                )
+            if next_mark is not None:
+                # the next stream starts after the inserted text
+                buffer.move_mark(
+                    next_mark, buffer.get_iter_at_offset(offset + len(text))
+                )
 
 
 if __name__ == "__main__":
@@ -19,8 +19,10 @@ import gi
 gi.require_version("Gst", "1.0")
 from gi.repository import Gst
 
+from queue_monitor import QueueMonitor
 
-def main():
+
+def main(queue_policy="observe"):
     # initialize GStreamer
     Gst.init(sys.argv)
 
@@ -94,6 +96,12 @@ def main():
     video_queue_pad = video_queue.get_static_pad("sink")
     tee_video_pad.link(video_queue_pad)
 
+    # watch the queues and report a video branch that stalls the tee while
+    # the audio branch starves. with the "leaky" or "throttle" policy it
+    # drops buffers instead
+    queue_monitor = QueueMonitor(pipeline, critical="audio_queue", policy=queue_policy)
+    queue_monitor.start()
+
     # start playing
     pipeline.set_state(Gst.State.PLAYING)
 
@@ -113,8 +121,10 @@ def main():
         if terminate:
             break
 
+    queue_monitor.stop()
     pipeline.set_state(Gst.State.NULL)
 
 
 if __name__ == "__main__":
-    main()
+    # pass "leaky" or "throttle" to let a slow video branch drop buffers
+    main(sys.argv[1] if len(sys.argv) > 1 else "observe")
@@ -4,7 +4,6 @@ https://gstreamer.freedesktop.org/documentation/tutorials/basic/short-cutting-th
 """
 
 import os
-from array import array
 
 os.environ["GST_DEBUG"] = "2"
 import logging
@@ -21,21 +20,49 @@ gi.require_version("Gst", "1.0")
 gi.require_version("GstAudio", "1.0")
 from gi.repository import GLib, Gst, GstAudio
 
+from appsink_reader import BatchPuller
+from appsrc_feed import (
+    AppSrcBufferPool,
+    ChunkSizer,
+    ProducerFeed,
+    in_flight_buffers,
+)
+from queue_monitor import QueueMonitor
+from waveform import WaveformSynth
+
 # Constants
 CHUNK_SIZE = 1024  # bytes per buffer
 SAMPLE_RATE = 44100  # samples per second
 
 
 class Generator:
-    def __init__(self):
+    def __init__(
+        self,
+        feed_mode="idle",
+        target_latency=None,
+        max_push_rate=50.0,
+        batch_ms=None,
+        queue_policy="observe",
+    ):
         Gst.init(sys.argv)
 
+        # "idle" feeds appsrc from a GLib idle callback on the main loop,
+        # "thread" generates and pushes data on dedicated threads
+        if feed_mode not in ("idle", "thread"):
+            raise ValueError(f"Unknown feed mode '{feed_mode}'")
+        self.feed_mode = feed_mode
+
+        # with a latency target, chunk sizes adapt to how appsrc drains,
+        # otherwise every chunk is CHUNK_SIZE bytes
+        self.chunk_sizer = None
+        if target_latency is not None:
+            self.chunk_sizer = ChunkSizer(
+                SAMPLE_RATE * 2, 2, target_latency, max_push_rate
+            )
+
         # Waveform generation variables
         self.num_samples = 0
-        self.a = 0.0
-        self.b = 1.0
-        self.c = 0.0
-        self.d = 1.0
+        self.synth = WaveformSynth(block_size=CHUNK_SIZE // 2)
         self.sourceid = None  # will hold the GLib source ID for the idle callback
 
         # Create elements
@@ -65,15 +92,49 @@ class Generator:
         audio_caps = info.to_caps()
         self.app_source.set_property("caps", audio_caps)
         self.app_source.set_property("format", Gst.Format.TIME)
+        # Bound the chunks queued in appsrc
+        if self.chunk_sizer is not None:
+            max_chunk = self.chunk_sizer.max_chunk
+            max_bytes = self.chunk_sizer.max_queue_bytes
+            min_chunk = self.chunk_sizer.min_chunk
+        else:
+            max_chunk = min_chunk = CHUNK_SIZE
+            max_bytes = CHUNK_SIZE * 16
+        self.app_source.set_property("max-bytes", max_bytes)
+
+        # Reuse preallocated buffers instead of allocating one per chunk. Every
+        # chunk queued in appsrc or in a tee branch keeps its pool buffer, so
+        # the pool covers all of them
+        max_buffers = in_flight_buffers(
+            max_bytes,
+            [self.audio_queue, self.video_queue, self.app_queue],
+            info.bpf * SAMPLE_RATE,
+            min_chunk,
+        )
+        self.buffer_pool = AppSrcBufferPool(
+            audio_caps, max_chunk, max_buffers=max_buffers
+        )
+
+        # Producer threads for the "thread" feed mode
+        self.producer = None
+        if self.feed_mode == "thread":
+            self.producer = ProducerFeed(self.app_source, self.make_buffer)
 
         # Connect appsrc signals for pushing data
         self.app_source.connect("need-data", self.start_feed)
         self.app_source.connect("enough-data", self.stop_feed)
 
         # Configure appsink
-        self.app_sink.set_property("emit-signals", True)
         self.app_sink.set_property("caps", audio_caps)
-        self.app_sink.connect("new-sample", self.new_sample)
+        self.batch_puller = None
+        if batch_ms is not None:
+            # drain appsink on a worker thread in batch_ms blocks of audio
+            self.batch_puller = BatchPuller(
+                self.app_sink, self.new_batch, batch_ms=batch_ms
+            )
+        else:
+            self.app_sink.set_property("emit-signals", True)
+            self.app_sink.connect("new-sample", self.new_sample)
 
         # Add elements to pipeline
         self.pipeline.add(self.app_source)
@@ -128,52 +189,69 @@ class Generator:
         app_queue_pad = self.app_queue.get_static_pad("sink")
         self.tee_app_pad.link(app_queue_pad)
 
+        # Report branches that stall the tee while the audio branch starves,
+        # and with the "leaky" or "throttle" policy let them drop buffers
+        self.queue_monitor = QueueMonitor(
+            self.pipeline, critical="audio_queue", policy=queue_policy
+        )
+
         # Set up bus for error messages and create main loop
         self.main_loop = GLib.MainLoop()
         bus = self.pipeline.get_bus()
         bus.add_signal_watch()
         bus.connect("message::error", self.error_cb)
 
-    def push_data(self, _):
-        """Pushes CHUNK_SIZE bytes of generated waveform data into appsrc."""
-        n_samples = CHUNK_SIZE // 2  # each sample is 2 bytes (16 bits)
-
-        # Generate waveform data
-        self.c += self.d
-        self.d -= self.c / 1000.0
-        freq = 1100 + 1000 * self.d
+    def chunk_size(self):
+        """Returns the number of bytes to generate for the next chunk."""
+        if self.chunk_sizer is not None:
+            return self.chunk_sizer.chunk_size
+        return CHUNK_SIZE
 
-        raw = array("H")
-        for i in range(n_samples):  # Replace xrange with range
-            self.a += self.b
-            self.b -= self.a / freq
-            a5 = (int(500 * self.a)) % 65535
-            raw.append(a5)
+    def make_buffer(self):
+        """Returns a buffer with one chunk of generated waveform data."""
+        n_samples = self.chunk_size() // 2  # each sample is 2 bytes (16 bits)
 
-        b_data = raw.tobytes()
+        # Generate waveform data for the whole chunk at once
+        block = self.synth.next_block(n_samples)
 
         self.num_samples += n_samples
 
-        # Set its timestamp and duration
-        buffer = Gst.Buffer.new_allocate(None, len(b_data), None)
-        buffer.fill(0, b_data)
+        # Take a buffer from the pool, then set its timestamp and duration
+        buffer = self.buffer_pool.acquire_filled(block)
         buffer.pts = Gst.util_uint64_scale(self.num_samples, Gst.SECOND, SAMPLE_RATE)
         buffer.duration = Gst.util_uint64_scale(n_samples, Gst.SECOND, SAMPLE_RATE)
 
-        ret = self.app_source.emit("push-buffer", buffer)
+        if self.chunk_sizer is not None:
+            self.chunk_sizer.record_push(self.app_source)
+        return buffer
+
+    def push_data(self, _):
+        """Pushes one generated chunk into appsrc (idle feed mode)."""
+        ret = self.app_source.emit("push-buffer", self.make_buffer())
         if ret != Gst.FlowReturn.OK:
             return False
         return True
 
     def start_feed(self, src, size):
         """Callback when appsrc needs data."""
-        if self.sourceid is None:
+        if self.chunk_sizer is not None:
+            self.chunk_sizer.record_need_data()
+        if self.producer is not None:
+            if not self.producer.need_data.is_set():
+                logger.info("Start feeding")
+            self.producer.resume()
+        elif self.sourceid is None:
             logger.info("Start feeding")
             self.sourceid = GLib.idle_add(self.push_data, None)
 
     def stop_feed(self, src):
         """Callback when appsrc has enough data."""
-        if self.sourceid is not None:
+        if self.chunk_sizer is not None:
+            self.chunk_sizer.record_enough_data()
+        if self.producer is not None:
+            logger.info("Stop feeding")
+            self.producer.pause()
+        elif self.sourceid is not None:
             logger.info("Stop feeding")
             GLib.source_remove(self.sourceid)
             self.sourceid = None
@@ -186,6 +264,10 @@ class Generator:
             return Gst.FlowReturn.OK
         return Gst.FlowReturn.ERROR
 
+    def new_batch(self, batch):
+        """Callback from the batch puller thread with a block of audio."""
+        logger.info(f"* {len(batch.samples.array)} frames, {batch.dropped} dropped")
+
     def error_cb(self, bus, msg):
         """Error callback for the bus."""
         err, debug_info = msg.parse_error()
@@ -195,6 +277,11 @@ class Generator:
 
     def run(self):
         """Starts the pipeline and runs the main loop."""
+        if self.producer is not None:
+            self.producer.start()
+        if self.batch_puller is not None:
+            self.batch_puller.start()
+        self.queue_monitor.start()
         self.pipeline.set_state(Gst.State.PLAYING)
         try:
             self.main_loop.run()
@@ -204,14 +291,32 @@ class Generator:
 
     def stop(self):
         """Stops the pipeline and cleans up resources."""
+        if self.chunk_sizer is not None:
+            logger.info(f"Chunk sizing metrics: {self.chunk_sizer.metrics()}")
+        if self.producer is not None:
+            self.producer.stop()
+        if self.batch_puller is not None:
+            self.batch_puller.stop()
+        self.queue_monitor.stop()
         # Release request pads from tee
         self.tee.release_request_pad(self.tee_audio_pad)
         self.tee.release_request_pad(self.tee_video_pad)
         self.tee.release_request_pad(self.tee_app_pad)
         self.pipeline.set_state(Gst.State.NULL)
+        self.buffer_pool.stop()
         self.pipeline.unref()
 
 
 if __name__ == "__main__":
-    generator = Generator()
+    # pass "thread" to generate data off the main loop, and a latency target
+    # in seconds (e.g. 0.1) to let the chunk size adapt, and a batch length
+    # in milliseconds to drain appsink on a worker thread, and "leaky" or
+    # "throttle" to let branches that stall the audio branch drop buffers
+    feed_mode = sys.argv[1] if len(sys.argv) > 1 else "idle"
+    target_latency = float(sys.argv[2]) if len(sys.argv) > 2 else None
+    batch_ms = float(sys.argv[3]) if len(sys.argv) > 3 else None
+    queue_policy = sys.argv[4] if len(sys.argv) > 4 else "observe"
+    generator = Generator(
+        feed_mode, target_latency, batch_ms=batch_ms, queue_policy=queue_policy
+    )
     generator.run()
@@ -7,7 +7,6 @@ import os
 
 os.environ["GST_DEBUG"] = "2"
 import logging
-import re
 import sys
 
 logging.basicConfig(
@@ -22,6 +21,8 @@ gi.require_version("GLib", "2.0")
 gi.require_version("GstPbutils", "1.0")
 from gi.repository import GLib, Gst, GstPbutils
 
+from media_info import taglist_to_dict
+
 
 def format_ns(ns):
     s, ns = divmod(ns, 1000000000)
@@ -31,20 +32,6 @@ def format_ns(ns):
     return "%u:%02u:%02u.%09u" % (h, m, s, ns)
 
 
-def parse_taglist(taglist):
-    taglist_str = taglist.to_string()
-    taglist_str = taglist_str[len("taglist, ") :].rstrip(";")
-    taglist_str = re.sub(r"\([^)]*\)", "", taglist_str)
-    taglist_str = taglist_str.replace('"', "")
-    taglist_str = taglist_str.replace("\\", "")
-    pattern = re.compile(r"\s*(?P<key>[\w-]+)=(?P<value>[^,]+)\s*(?:,|$)")
-    parsed_dict = {
-        match.group("key"): match.group("value").strip()
-        for match in pattern.finditer(taglist_str)
-    }
-    return parsed_dict
-
-
 class DiscovererApp:
     def __init__(self, uri, timeout=5 * Gst.SECOND):
         self.uri = uri
@@ -70,7 +57,7 @@ class DiscovererApp:
         tags = sinfo.get_tags()
         if tags:
             logger.info(f"{' ' * 2*(depth+1)}Tags:")
-            tags_dict = parse_taglist(tags)
+            tags_dict = taglist_to_dict(tags)
             for tag_name, tag_value in tags_dict.items():
                 logger.info(f"{' ' * 2*(depth+2)}{tag_name}: {tag_value}")
 
@@ -118,7 +105,7 @@ class DiscovererApp:
         tags = info.get_tags()
         if tags:
             logger.info("Tags:")
-            tags_dict = parse_taglist(tags)
+            tags_dict = taglist_to_dict(tags)
             for tag_name, tag_value in tags_dict.items():
                 logger.info(f"  {tag_name}: {tag_value}")
 
@@ -0,0 +1,270 @@
+"""
+Cost-aware conversion chains between raw caps.
+
+bt03, bt07 and bt08 put `audioconvert`, `audioresample` or `videoconvert` in
+front of every sink "just in case". ConversionPlanner works out which
+conversions a source / sink pair really needs:
+
+- it fixates every field the sink does not accept as it is to the nearest
+  allowed value, and picks the output format that keeps the data smallest,
+- it chooses the converters for the fields that change (videoconvert,
+  videoscale, videorate, or videoconvertscale when it is installed;
+  audioconvert, audioresample) from the registry index of registry_index.py,
+- it orders them so the expensive steps run on the smallest data, e.g. scale
+  down before converting the format, convert to fewer channels before
+  resampling, with the cost being the bytes per second every step reads and
+  writes.
+
+The plan also tells which converters of an existing chain will only run in
+passthrough.
+
+    python conversion_planner.py video/x-raw,format=I420,width=1920,height=1080,framerate=30/1 \\
+        "video/x-raw,format={RGB,BGRx},width=[1,640],height=[1,360]"
+"""
+
+import collections
+import itertools
+import logging
+import sys
+
+import gi
+
+gi.require_version("Gst", "1.0")
+gi.require_version("GstAudio", "1.0")
+gi.require_version("GstVideo", "1.0")
+from gi.repository import Gst, GstAudio, GstVideo
+
+from registry_index import load_index
+
+logger = logging.getLogger(__name__)
+
+# media type: (fields read from fixed caps, converters as {factory: fields})
+MEDIA = {
+    "video/x-raw": {
+        "fields": {
+            "format": "string",
+            "width": "int",
+            "height": "int",
+            "framerate": "fraction",
+        },
+        "converters": {
+            "videoconvert": {"format"},
+            "videoscale": {"width", "height"},
+            "videorate": {"framerate"},
+            "videoconvertscale": {"format", "width", "height"},
+        },
+    },
+    "audio/x-raw": {
+        "fields": {
+            "format": "string",
+            "rate": "int",
+            "channels": "int",
+            "layout": "string",
+        },
+        "converters": {
+            "audioconvert": {"format", "channels", "layout"},
+            "audioresample": {"rate"},
+        },
+    },
+}
+
+Plan = collections.namedtuple(
+    "Plan", ["chain", "caps", "target", "cost", "passthrough", "unchanged"]
+)
+
+
+def read_fields(structure, fields):
+    values = {}
+    for field, kind in fields.items():
+        if kind == "string":
+            value = structure.get_string(field)
+            ok = value is not None
+        elif kind == "int":
+            ok, value = structure.get_int(field)
+        else:
+            ok, num, denom = structure.get_fraction(field)
+            value = (num, denom)
+        if ok:
+            values[field] = value
+    return values
+
+
+def caps_string(media_type, values):
+    parts = [media_type]
+    for field, value in values.items():
+        if isinstance(value, tuple):
+            value = f"{value[0]}/{value[1]}"
+        parts.append(f"{field}={value}")
+    return ",".join(parts)
+
+
+def byte_rate(media_type, values):
+    """Bytes per second of raw media described by `values`."""
+    caps = Gst.Caps.from_string(caps_string(media_type, values))
+    if media_type == "audio/x-raw":
+        info = GstAudio.AudioInfo.new_from_caps(caps)
+        return info.bpf * info.rate if info else float("inf")
+    info = GstVideo.VideoInfo.new_from_caps(caps)
+    if info is None:
+        return float("inf")
+    num, denom = values.get("framerate", (30, 1))
+    return info.size * (num / denom if num else 30)
+
+
+def format_names(media_type):
+    if media_type == "audio/x-raw":
+        enum, unknown = GstAudio.AudioFormat, ("UNKNOWN", "ENCODED")
+    else:
+        enum, unknown = GstVideo.VideoFormat, ("UNKNOWN", "ENCODED", "DMA_DRM")
+    names = [enum.to_string(value) for value in enum.__enum_values__.values()]
+    return [name for name in names if name and name not in unknown]
+
+
+class ConversionPlanner:
+    """Plans conversion chains with the element factories of `index`."""
+
+    def __init__(self, index=None):
+        self.index = index or load_index()
+
+    def sink_caps(self, sink):
+        """Caps from a caps string, or from the sink templates of a factory
+        name (e.g. "ximagesink")."""
+        if sink in self.index.factories:
+            caps = Gst.Caps.new_empty()
+            for template in self.index.factories[sink].templates:
+                if template.direction == "sink":
+                    caps.append(Gst.Caps.from_string(template.caps))
+            return caps
+        return Gst.Caps.from_string(sink)
+
+    def targets(self, media_type, source, sink_caps):
+        """Yields the fixated target values, one per acceptable format."""
+        fields = MEDIA[media_type]["fields"]
+        structure = None
+        for i in range(sink_caps.get_size()):
+            if sink_caps.get_structure(i).get_name() == media_type:
+                structure = sink_caps.get_structure(i).copy()
+                break
+        if structure is None:
+            raise ValueError(f"Sink does not accept {media_type}")
+
+        fixed = {}
+        for field, value in source.items():
+            if field == "format":
+                continue
+            single = Gst.Caps.from_string(caps_string(media_type, {field: value}))
+            if sink_caps.can_intersect(single):
+                fixed[field] = value
+                continue
+            # keep the value closest to the source
+            if fields[field] == "int":
+                structure.fixate_field_nearest_int(field, value)
+            elif fields[field] == "fraction":
+                structure.fixate_field_nearest_fraction(field, *value)
+            else:
+                structure.fixate_field(field)
+            fixed.update(read_fields(structure, {field: fields[field]}))
+
+        formats = [source["format"]] + [
+            name for name in format_names(media_type) if name != source["format"]
+        ]
+        for name in formats:
+            target = {"format": name, **fixed}
+            if sink_caps.can_intersect(
+                Gst.Caps.from_string(caps_string(media_type, target))
+            ):
+                yield target
+                if name == source["format"]:
+                    # no format conversion is always the cheapest
+                    return
+
+    def chain_cost(self, media_type, source, target, chain):
+        converters = MEDIA[media_type]["converters"]
+        current = dict(source)
+        caps = []
+        cost = 0.0
+        for name in chain:
+            following = dict(current)
+            for field in converters[name]:
+                if field in target:
+                    following[field] = target[field]
+            cost += byte_rate(media_type, current) + byte_rate(media_type, following)
+            caps.append(caps_string(media_type, following))
+            current = following
+        return cost, caps
+
+    def chains(self, media_type, changed):
+        """Every ordering of every set of available converters covering
+        `changed`, without converters that have nothing to do."""
+        converters = {
+            name: fields
+            for name, fields in MEDIA[media_type]["converters"].items()
+            if name in self.index.factories and fields & changed
+        }
+        for n in range(len(converters) + 1):
+            for names in itertools.permutations(converters, n):
+                covered = set().union(*(converters[name] for name in names))
+                overlap = sum(len(converters[name] & changed) for name in names)
+                if changed <= covered and overlap == len(changed & covered):
+                    yield list(names)
+
+    def plan(self, src_caps, sink, existing=()):
+        """Returns the cheapest Plan from fixed `src_caps` to `sink` (caps
+        or a sink factory name). `existing` lists the converters currently
+        in the pipeline, to report which of them would be passthrough."""
+        src = Gst.Caps.from_string(src_caps)
+        media_type = src.get_structure(0).get_name()
+        if media_type not in MEDIA:
+            raise ValueError(
+                f"Only raw audio and video can be planned, not {media_type}"
+            )
+        source = read_fields(src.get_structure(0), MEDIA[media_type]["fields"])
+        sink_caps = self.sink_caps(sink)
+
+        best = None
+        for target in self.targets(media_type, source, sink_caps):
+            changed = {field for field in target if target[field] != source.get(field)}
+            for chain in self.chains(media_type, changed):
+                cost, caps = self.chain_cost(media_type, source, target, chain)
+                if best is None or cost < best[0]:
+                    best = (cost, chain, caps, target, changed)
+        if best is None:
+            raise ValueError(f"No conversion from {src_caps} to {sink}")
+
+        cost, chain, caps, target, changed = best
+        converters = MEDIA[media_type]["converters"]
+        passthrough = [
+            name
+            for name in existing
+            if name in converters and not converters[name] & changed
+        ]
+        return Plan(
+            chain,
+            caps,
+            caps_string(media_type, target),
+            cost,
+            passthrough,
+            sorted(set(source) - changed),
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    Gst.init(sys.argv)
+    if len(sys.argv) < 3:
+        raise SystemExit(
+            "Usage: conversion_planner.py <source caps> <sink caps or factory>"
+        )
+    src_caps, sink = sys.argv[1], sys.argv[2]
+    media_type = Gst.Caps.from_string(src_caps).get_structure(0).get_name()
+    existing = list(MEDIA.get(media_type, {}).get("converters", {}))
+
+    plan = ConversionPlanner().plan(src_caps, sink, existing)
+    logger.info(f"Target caps: {plan.target}")
+    logger.info(f"Chain: {' ! '.join(plan.chain) or '(none, link directly)'}")
+    for name, caps in zip(plan.chain, plan.caps):
+        logger.info(f"  {name} -> {caps}")
+    logger.info(f"Bytes processed per second: {plan.cost / 1e6:.1f} MB")
+    logger.info(f"Passthrough if present: {', '.join(plan.passthrough) or 'none'}")
@@ -0,0 +1,218 @@
+"""
+Persistent discovery cache keyed by file identity.
+
+Every run of bt09 probes the media again, even when the file did not change.
+DiscoveryCache stores the full discovery record of batch_discovery.py
+(duration, seekability, tags and stream topology) in SQLite, keyed by path,
+size and mtime, and optionally by a hash of the first and last 64 KiB of the
+file, for filesystems where mtime cannot be trusted. A repeated lookup is a
+`stat` and one indexed SELECT; `refresh()` only re-discovers files that are
+new or changed.
+
+    python discovery_cache.py /app/videos
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+from batch_discovery import discover, discover_batch, iter_uris
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "gst-discovery-cache.sqlite",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    hash TEXT,
+    record TEXT NOT NULL,
+    discovered_at REAL NOT NULL
+)
+"""
+
+# bumped whenever the record format changes, older caches are dropped
+SCHEMA_VERSION = 1
+
+HASH_BLOCK = 64 * 1024
+
+
+def content_hash(path, size):
+    """SHA-1 of the size and the first and last 64 KiB of the file."""
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(HASH_BLOCK))
+        if size > HASH_BLOCK:
+            f.seek(max(size - HASH_BLOCK, HASH_BLOCK))
+            digest.update(f.read(HASH_BLOCK))
+    return digest.hexdigest()
+
+
+class DiscoveryCache:
+    """Discovery records in SQLite, valid while the file is unchanged."""
+
+    def __init__(self, path=DB_PATH, use_hash=False):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            # unversioned caches (0) hold tags as serialized strings
+            self.db.execute("DROP TABLE IF EXISTS media")
+            self.db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self.db.execute(SCHEMA)
+        self.use_hash = use_hash
+        self.hits = 0
+        self.misses = 0
+        self.lookup_ns = []
+
+    def identity(self, uri):
+        """(path, size, mtime, hash) of a file:// URI, None otherwise."""
+        if not uri.startswith("file://"):
+            return None
+        path = Gst.uri_get_location(uri)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        digest = content_hash(path, stat.st_size) if self.use_hash else None
+        return path, stat.st_size, stat.st_mtime_ns, digest
+
+    def lookup(self, uri, identity=None):
+        """Returns the cached record of `uri` if the file is unchanged."""
+        start = time.perf_counter_ns()
+        identity = identity or self.identity(uri)
+        record = None
+        if identity is not None:
+            path, size, mtime, digest = identity
+            row = self.db.execute(
+                "SELECT size, mtime, hash, record FROM media WHERE path = ?", (path,)
+            ).fetchone()
+            if row is not None and row[:2] == (size, mtime):
+                if digest is None or row[2] == digest:
+                    record = json.loads(row[3])
+        self.lookup_ns.append(time.perf_counter_ns() - start)
+        if record is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return record
+
+    def store(self, uri, record, identity=None):
+        identity = identity or self.identity(uri)
+        # only successful discoveries are cached, errors may be transient
+        if identity is None or record.get("result") != "ok":
+            return
+        self.db.execute(
+            "INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?)",
+            (*identity, json.dumps(record), time.time()),
+        )
+        self.db.commit()
+
+    def discover(self, uri, timeout=5 * Gst.SECOND):
+        """The cached record of `uri`, discovering it on a miss."""
+        identity = self.identity(uri)
+        record = self.lookup(uri, identity)
+        if record is None:
+            record = discover(uri, timeout)
+            self.store(uri, record, identity)
+        return record
+
+    def refresh(self, uris, workers=4, processes=False, timeout=5 * Gst.SECOND):
+        """Yields a record per URI, re-discovering only new or changed
+        files (concurrently, with batch_discovery)."""
+        stale = {}
+        for uri in uris:
+            identity = self.identity(uri)
+            record = self.lookup(uri, identity)
+            if record is not None:
+                yield record
+            else:
+                stale[uri] = identity
+
+        for record in discover_batch(stale, workers, processes, timeout):
+            self.store(record["uri"], record, stale.get(record["uri"]))
+            yield record
+
+    def prune(self):
+        """Drops the entries of files that no longer exist."""
+        paths = [row[0] for row in self.db.execute("SELECT path FROM media")]
+        gone = [(path,) for path in paths if not os.path.exists(path)]
+        self.db.executemany("DELETE FROM media WHERE path = ?", gone)
+        self.db.commit()
+        return len(gone)
+
+    def stats(self):
+        lookups = sorted(self.lookup_ns) or [0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "lookup_us_median": statistics.median(lookups) / 1e3,
+            "lookup_us_p99": lookups[int(0.99 * (len(lookups) - 1))] / 1e3,
+        }
+
+    def close(self):
+        self.db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("sources", nargs="*", help="directories, files or URIs")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--hash", action="store_true", help="also check content")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", help="JSONL file")
+    args = parser.parse_args()
+
+    Gst.init(None)
+    cache = DiscoveryCache(args.db, args.hash)
+    logger.info(f"Pruned {cache.prune()} entries of deleted files")
+    output = open(args.output, "w") if args.output else None
+    start = time.perf_counter()
+    count = 0
+    for record in cache.refresh(iter_uris(args.sources), args.workers):
+        count += 1
+        if output:
+            output.write(json.dumps(record) + "\n")
+    elapsed = time.perf_counter() - start
+    if output:
+        output.close()
+    cache.close()
+
+    logger.info(
+        f"{count} files in {elapsed:.2f}s "
+        f"({count / elapsed if elapsed else 0:.1f} files/s)"
+    )
+    stats = cache.stats()
+    logger.info(
+        f"Cache: {stats['hits']} hits, {stats['misses']} misses "
+        f"(hit ratio {stats['hit_ratio']:.1%}), lookup median "
+        f"{stats['lookup_us_median']:.1f} us, p99 {stats['lookup_us_p99']:.1f} us"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    sys.exit(main())
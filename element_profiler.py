@@ -0,0 +1,210 @@
+"""
+Per-element processing time and converter passthrough in a running pipeline.
+
+ElementProfiler attaches buffer probes to the pads of every element of a
+pipeline (also of elements and pads added later, e.g. by decodebin) and
+measures, per streaming thread, the time from a buffer reaching an element's
+sink pad to the element pushing its output on a src pad. Time spent
+downstream is not included, and neither is the time a queue holds a buffer,
+since its output is pushed from another thread. Sinks have no src pad, so
+only their buffer counts are reported.
+
+For every converter (any Gst.BaseTransform, e.g. videoconvert, audioconvert,
+audioresample) it also reports whether it runs in passthrough. Nothing needs
+to be rebuilt and no GST_DEBUG log or tracer has to be enabled before start;
+the probes themselves cost a few microseconds per buffer and pad, which is
+included in the numbers.
+
+Run this file with a name from pipeline_bench.BENCHMARKS to profile that
+tutorial pipeline.
+"""
+
+import logging
+import sys
+import threading
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+gi.require_version("GstBase", "1.0")
+from gi.repository import Gst, GstBase
+
+from pipeline_bench import BENCHMARKS
+from tee_branches import iterate
+
+logger = logging.getLogger(__name__)
+
+
+class ElementStats:
+    def __init__(self, element):
+        self.element = element
+        self.name = element.get_name()
+        self.factory = element.get_factory().get_name() if element.get_factory() else ""
+        self.buffers = 0
+        self.timed = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.source = not list(iterate(element.iterate_sink_pads()))
+
+    def passthrough(self):
+        """True/False for transforms, None for other elements."""
+        if isinstance(self.element, GstBase.BaseTransform):
+            return self.element.is_passthrough()
+        return None
+
+
+class ElementProfiler:
+    """Collects ElementStats for every element of `pipeline`."""
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.stats = {}
+        self.lock = threading.Lock()
+        # per thread: element -> arrival time of the buffer it is processing
+        self.local = threading.local()
+        self.probes = []
+        self.handlers = []
+        self.start_time = None
+
+    def attach(self):
+        self.start_time = time.perf_counter()
+        self.handlers.append(
+            (
+                self.pipeline,
+                self.pipeline.connect("deep-element-added", self.on_element_added),
+            )
+        )
+        for element in iterate(self.pipeline.iterate_recurse()):
+            self.attach_element(element)
+
+    def on_element_added(self, bin, sub_bin, element):
+        self.attach_element(element)
+
+    def attach_element(self, element):
+        if isinstance(element, Gst.Bin):
+            # a bin's ghost pads forward to its children, which are profiled
+            return
+        with self.lock:
+            if element in self.stats:
+                return
+            stats = ElementStats(element)
+            self.stats[element] = stats
+        for pad in iterate(element.iterate_pads()):
+            self.attach_pad(pad, stats)
+        self.handlers.append(
+            (element, element.connect("pad-added", self.on_pad_added, stats))
+        )
+
+    def on_pad_added(self, element, pad, stats):
+        self.attach_pad(pad, stats)
+
+    def attach_pad(self, pad, stats):
+        if pad.get_direction() == Gst.PadDirection.SINK:
+            callback = self.on_sink_buffer
+        else:
+            callback = self.on_src_buffer
+        probe_type = Gst.PadProbeType.BUFFER | Gst.PadProbeType.BUFFER_LIST
+        self.probes.append((pad, pad.add_probe(probe_type, callback, stats)))
+
+    def arrivals(self):
+        arrivals = getattr(self.local, "arrivals", None)
+        if arrivals is None:
+            arrivals = self.local.arrivals = {}
+        return arrivals
+
+    def on_sink_buffer(self, pad, info, stats):
+        stats.buffers += 1
+        self.arrivals()[stats] = time.perf_counter_ns()
+        return Gst.PadProbeReturn.OK
+
+    def on_src_buffer(self, pad, info, stats):
+        arrived = self.arrivals().pop(stats, None)
+        if arrived is not None:
+            elapsed = time.perf_counter_ns() - arrived
+            stats.timed += 1
+            stats.total_ns += elapsed
+            stats.max_ns = max(stats.max_ns, elapsed)
+        elif stats.source:
+            # sources only produce
+            stats.buffers += 1
+        return Gst.PadProbeReturn.OK
+
+    def detach(self):
+        for pad, probe_id in self.probes:
+            pad.remove_probe(probe_id)
+        for obj, handler in self.handlers:
+            obj.disconnect(handler)
+        self.probes = []
+        self.handlers = []
+
+    def report(self):
+        """Elements sorted by processing time, as a list of dicts."""
+        wall = time.perf_counter() - self.start_time
+        rows = []
+        with self.lock:
+            stats_list = list(self.stats.values())
+        total = sum(stats.total_ns for stats in stats_list) or 1
+        for stats in stats_list:
+            rows.append(
+                {
+                    "element": stats.name,
+                    "factory": stats.factory,
+                    "buffers": stats.buffers,
+                    "total_ms": stats.total_ns / 1e6,
+                    "mean_us": (
+                        stats.total_ns / stats.timed / 1e3 if stats.timed else None
+                    ),
+                    "max_us": stats.max_ns / 1e3,
+                    "share": stats.total_ns / total,
+                    "cpu_load": stats.total_ns / 1e9 / wall if wall else 0.0,
+                    "passthrough": stats.passthrough(),
+                }
+            )
+        rows.sort(key=lambda row: row["total_ms"], reverse=True)
+        return rows
+
+    def log_report(self):
+        for row in self.report():
+            mean = (
+                f"{row['mean_us']:9.1f} us" if row["mean_us"] is not None else " " * 12
+            )
+            passthrough = {True: "passthrough", False: "converting", None: ""}
+            logger.info(
+                f"{row['element']:24s} {row['factory']:16s} "
+                f"{row['buffers']:7d} buffers {row['total_ms']:9.1f} ms "
+                f"{mean} {row['share']:6.1%}  {passthrough[row['passthrough']]}"
+            )
+
+
+def profile(description, seconds=5.0):
+    """Profiles a launch description for `seconds` (or until EOS)."""
+    pipeline = Gst.parse_launch(description)
+    profiler = ElementProfiler(pipeline)
+    profiler.attach()
+    pipeline.set_state(Gst.State.PLAYING)
+    msg = pipeline.get_bus().timed_pop_filtered(
+        int(seconds * Gst.SECOND), Gst.MessageType.ERROR | Gst.MessageType.EOS
+    )
+    if msg is not None and msg.type == Gst.MessageType.ERROR:
+        err, debug_info = msg.parse_error()
+        logger.error(f"Error received from element {msg.src.get_name()}: {err.message}")
+    profiler.log_report()
+    profiler.detach()
+    pipeline.set_state(Gst.State.NULL)
+    return profiler
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    Gst.init(sys.argv)
+    names = sys.argv[1:] or [
+        "bt02_gstreamer_concepts",
+        "bt07_multithreading_and_pad_availability",
+        "bt08_short_cutting_the_pipeline",
+    ]
+    for name in names:
+        logger.info(f"--- {name}")
+        profile(BENCHMARKS[name].format(n=300))
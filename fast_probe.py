@@ -0,0 +1,271 @@
+"""
+Header-only fast discovery.
+
+GstPbutils.Discoverer (bt09, batch_discovery.py) plugs decoders and prerolls
+them to fill in its stream info, which is most of the time spent per file
+when only the container, duration and codec names are needed. `probe()`
+runs `source ! typefind ! parsebin` instead: typefinding, demuxing and
+parsing, up to the first parsed buffer of every stream, and never a
+decoder. It returns a record in the format of batch_discovery.py, with the
+stream caps as the parsers report them.
+
+Full discovery is only used when the requested fields need it (`live`), when
+the fast probe fails or cannot preroll (live sources), or when it could not
+find a requested field, e.g. the duration of a stream without an index.
+
+    python fast_probe.py /app/videos --output library.jsonl
+    python fast_probe.py /app/videos --benchmark
+"""
+
+import argparse
+import functools
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+gi.require_version("GLib", "2.0")
+gi.require_version("GstPbutils", "1.0")
+from gi.repository import GLib, Gst, GstPbutils
+
+from batch_discovery import discover, discover_batch, iter_uris
+from media_info import taglist_to_dict
+from offline import element_klass
+from tee_branches import iterate
+
+logger = logging.getLogger(__name__)
+
+# record fields the fast probe fills in, everything else needs discovery
+FAST_FIELDS = {"duration", "seekable", "tags", "streams"}
+DEFAULT_FIELDS = ("duration", "streams")
+
+
+def stream_type(caps):
+    """The Discoverer stream type nick of parsed `caps`."""
+    name = caps.get_structure(0).get_name()
+    if name.startswith(("video/", "image/")):
+        return "video"
+    if name.startswith("audio/"):
+        return "audio"
+    if name.startswith(("text/", "subtitle/", "application/x-ssa")):
+        return "subtitles"
+    return "unknown"
+
+
+def caps_to_dict(kind, caps, tags=None):
+    if caps.is_fixed():
+        description = GstPbutils.pb_utils_get_codec_description(caps)
+    else:
+        description = caps.to_string()
+    return {
+        "type": kind,
+        "caps": caps.to_string(),
+        "description": description,
+        "tags": tags,
+        "children": [],
+    }
+
+
+def fast_probe(uri, timeout=5 * Gst.SECOND):
+    """Typefinds and demuxes `uri` without decoding, returns its record."""
+    record = {"uri": uri, "result": "error", "mode": "fast"}
+    try:
+        source = Gst.Element.make_from_uri(Gst.URIType.SRC, uri, None)
+    except GLib.Error as err:
+        record.update(result="uri-invalid", error=err.message)
+        return record
+
+    pipeline = Gst.Pipeline.new(None)
+    typefind = Gst.ElementFactory.make("typefind", None)
+    parser = Gst.ElementFactory.make("parsebin", None)
+    for element in (source, typefind, parser):
+        pipeline.add(element)
+    source.link(typefind)
+    typefind.link(parser)
+
+    pads = []
+
+    def on_pad_added(src, new_pad):
+        # a fakesink per stream, preroll completes once every stream has
+        # its caps, tags and first parsed buffer
+        sink = Gst.ElementFactory.make("fakesink", None)
+        sink.set_property("sync", False)
+        sink.set_property("enable-last-sample", False)
+        pipeline.add(sink)
+        sink.sync_state_with_parent()
+        new_pad.link(sink.get_static_pad("sink"))
+        pads.append(new_pad)
+
+    parser.connect("pad-added", on_pad_added)
+    try:
+        ret = pipeline.set_state(Gst.State.PAUSED)
+        if ret == Gst.StateChangeReturn.NO_PREROLL:
+            record["error"] = "live source, cannot preroll"
+            return record
+        msg = pipeline.get_bus().timed_pop_filtered(
+            timeout, Gst.MessageType.ASYNC_DONE | Gst.MessageType.ERROR
+        )
+        if msg is None:
+            record["result"] = "timeout"
+            return record
+        if msg.type == Gst.MessageType.ERROR:
+            err, debug_info = msg.parse_error()
+            record["error"] = err.message
+            return record
+
+        streams = []
+        tags = {}
+        for pad in pads:
+            caps = pad.get_current_caps()
+            if caps is None:
+                continue
+            event = pad.get_sticky_event(Gst.EventType.TAG, 0)
+            stream_tags = taglist_to_dict(event.parse_tag()) if event else None
+            for name, value in (stream_tags or {}).items():
+                tags.setdefault(name, value)
+            streams.append(caps_to_dict(stream_type(caps), caps, stream_tags))
+
+        container_caps = typefind.get_property("caps")
+        demuxed = any(
+            "Demux" in element_klass(element)
+            for element in iterate(parser.iterate_recurse())
+        )
+        if demuxed and container_caps is not None:
+            topology = caps_to_dict("container", container_caps)
+            topology["children"] = streams
+        elif len(streams) == 1:
+            topology = streams[0]
+        else:
+            topology = None
+
+        ok, duration = pipeline.query_duration(Gst.Format.TIME)
+        query = Gst.Query.new_seeking(Gst.Format.TIME)
+        seekable = None
+        if pipeline.query(query):
+            seekable = query.parse_seeking()[1]
+        record.update(
+            result="ok",
+            duration=duration if ok and duration >= 0 else None,
+            seekable=seekable,
+            tags=tags or None,
+            streams=topology,
+        )
+        return record
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+
+
+def probe(uri, timeout=5 * Gst.SECOND, fields=DEFAULT_FIELDS):
+    """The record of `uri` with at least `fields`, probed header-only when
+    that is enough and discovered fully otherwise."""
+    start = time.perf_counter()
+    fields = set(fields)
+    if fields <= FAST_FIELDS:
+        record = fast_probe(uri, timeout)
+        missing = [field for field in fields if record.get(field) is None]
+        if record["result"] == "ok" and not missing:
+            record["elapsed"] = time.perf_counter() - start
+            return record
+        if record["result"] != "ok":
+            reason = record.get("error") or record["result"]
+        else:
+            reason = f"no {', '.join(missing)}"
+        logger.debug(f"fast probe of '{uri}' failed ({reason}), using discovery")
+    record = discover(uri, timeout)
+    record["mode"] = "full"
+    record["elapsed"] = time.perf_counter() - start
+    return record
+
+
+def benchmark(uris, repeat=3, timeout=5 * Gst.SECOND):
+    """Logs the median probe latency of both modes on the same files."""
+    uris = list(uris)
+    if not uris:
+        return
+    # load the plugins of both modes once before timing
+    fast_probe(uris[0], timeout)
+    discover(uris[0], timeout)
+
+    fast_times = []
+    full_times = []
+    for uri in uris:
+        fast = []
+        full = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fast_probe(uri, timeout)
+            fast.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            discover(uri, timeout)
+            full.append(time.perf_counter() - start)
+        fast_times.append(statistics.median(fast))
+        full_times.append(statistics.median(full))
+        logger.info(
+            f"{os.path.basename(Gst.uri_get_location(uri) or uri)}: "
+            f"fast {1000 * fast_times[-1]:.1f} ms, full {1000 * full_times[-1]:.1f} ms"
+        )
+
+    fast = statistics.median(fast_times)
+    full = statistics.median(full_times)
+    logger.info(
+        f"Median over {len(uris)} files: fast {1000 * fast:.1f} ms, "
+        f"full {1000 * full:.1f} ms ({full / fast if fast else 0:.1f}x)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("sources", nargs="*", help="directories, files or URIs")
+    parser.add_argument(
+        "--fields",
+        default=",".join(DEFAULT_FIELDS),
+        help=f"comma separated record fields, fast: {', '.join(sorted(FAST_FIELDS))}",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--timeout", type=float, default=5.0, help="seconds per file")
+    parser.add_argument("--output", help="JSONL file (default: stdout)")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    Gst.init(None)
+    timeout = int(args.timeout * Gst.SECOND)
+    uris = iter_uris(args.sources or ["/app/videos"])
+    if args.benchmark:
+        benchmark(uris, args.repeat, timeout)
+        return 0
+
+    fields = [field.strip() for field in args.fields.split(",") if field.strip()]
+    output = open(args.output, "w") if args.output else sys.stdout
+    start = time.perf_counter()
+    modes = {"fast": 0, "full": 0}
+    for record in discover_batch(
+        uris,
+        args.workers,
+        timeout=timeout,
+        probe=functools.partial(probe, fields=fields),
+    ):
+        output.write(json.dumps(record) + "\n")
+        modes[record.get("mode", "full")] += 1
+    elapsed = time.perf_counter() - start
+    if output is not sys.stdout:
+        output.close()
+
+    count = sum(modes.values())
+    logger.info(
+        f"Probed {count} files ({modes['fast']} fast, {modes['full']} full) "
+        f"in {elapsed:.2f}s, {count / elapsed if elapsed else 0:.1f} files/s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+Frames at many timestamps from one decode pipeline.
+
+Grabbing a frame with a bt01/bt04-style playbin means building, prerolling
+and tearing down a pipeline per frame. FrameExtractor opens a single
+`uridecodebin ! videoconvert ! appsink` pipeline and walks a sorted list of
+timestamps: targets close ahead of the current position are reached by
+decoding forward, farther ones by a flushing ACCURATE seek. Frames come back
+as NumPy arrays (RGB by default) or as JPEG/PNG bytes.
+
+`extract_frames()` splits large jobs into contiguous runs of timestamps, one
+per worker process, each with its own pipeline.
+
+Run this file with a URI to compare frames per second of one pipeline per
+frame, one pipeline per job and a process pool.
+"""
+
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+from appsink_reader import AppSinkReader
+
+logger = logging.getLogger(__name__)
+
+ENCODERS = {
+    "array": "video/x-raw,format={format}",
+    "jpeg": "jpegenc",
+    "png": "pngenc",
+}
+
+
+class FrameExtractor:
+    """Extracts frames of `uri` with one pipeline.
+
+    `output` is "array" (a NumPy array in `format`, a tuple of plane arrays
+    for planar formats such as I420 or NV12), "jpeg" or "png" (bytes).
+    Targets less than `max_forward` ns ahead of the last frame are reached by
+    decoding forward instead of seeking, which is cheaper within a GOP.
+    """
+
+    def __init__(self, uri, output="array", format="RGB", max_forward=Gst.SECOND):
+        if output not in ENCODERS:
+            raise ValueError(f"Unknown output '{output}'")
+        self.output = output
+        self.max_forward = max_forward
+        self.pipeline = Gst.parse_launch(
+            f"uridecodebin name=source uri={uri} caps=video/x-raw "
+            "expose-all-streams=false ! videoconvert ! "
+            f"{ENCODERS[output].format(format=format)} ! "
+            "appsink name=sink sync=false max-buffers=2"
+        )
+        self.app_sink = self.pipeline.get_by_name("sink")
+        self.reader = AppSinkReader(self.app_sink)
+        self.position = None
+        # last frame returned and the end of its display time
+        self.sample = None
+        self.end = None
+        self.seeks = 0
+        self.decoded = 0
+
+        self.pipeline.set_state(Gst.State.PLAYING)
+        ret, state, pending = self.pipeline.get_state(10 * Gst.SECOND)
+        if ret == Gst.StateChangeReturn.FAILURE:
+            self.close()
+            raise RuntimeError(f"Could not open '{uri}'")
+
+    def pull(self):
+        """Returns (stream time, sample) of the next frame, None at EOS."""
+        sample = self.app_sink.emit("try-pull-sample", 10 * Gst.SECOND)
+        if sample is None:
+            return None
+        self.decoded += 1
+        pts = sample.get_buffer().pts
+        position = sample.get_segment().to_stream_time(Gst.Format.TIME, pts)
+        return position, sample
+
+    def frame(self, timestamp):
+        """Returns the first frame at or after `timestamp` (ns), or None."""
+        if self.sample is not None and self.position <= timestamp < self.end:
+            # still the frame shown at `timestamp`
+            return self.convert(self.sample)
+        ahead = self.position is not None and (
+            0 <= timestamp - self.position <= self.max_forward
+        )
+        if not ahead:
+            self.seeks += 1
+            self.sample = None
+            if not self.pipeline.seek_simple(
+                Gst.Format.TIME,
+                Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE,
+                timestamp,
+            ):
+                logger.error(f"Seek to {timestamp / Gst.SECOND:.3f}s failed")
+                return None
+
+        while True:
+            pulled = self.pull()
+            if pulled is None:
+                return None
+            self.position, sample = pulled
+            # a frame lasting past the target is the one shown at that time
+            duration = sample.get_buffer().duration
+            end = self.position + (duration if duration != Gst.CLOCK_TIME_NONE else 0)
+            if end > timestamp or self.position >= timestamp:
+                self.sample, self.end = sample, end
+                return self.convert(sample)
+
+    def convert(self, sample):
+        if self.output == "array":
+            # copy so the decoder gets its buffer back and the frame pickles
+            array = self.reader.to_array(sample).array
+            if isinstance(array, tuple):
+                # planar formats (I420, NV12, ...) give one array per plane
+                return tuple(plane.copy() for plane in array)
+            return array.copy()
+        return sample.get_buffer().extract_dup(0, sample.get_buffer().get_size())
+
+    def frames(self, timestamps):
+        """Yields (timestamp, frame) for every timestamp, in sorted order."""
+        for timestamp in sorted(timestamps):
+            yield timestamp, self.frame(timestamp)
+
+    def close(self):
+        self.pipeline.set_state(Gst.State.NULL)
+
+
+def extract_chunk(uri, timestamps, output, format):
+    Gst.init(None)
+    extractor = FrameExtractor(uri, output, format)
+    try:
+        return list(extractor.frames(timestamps))
+    finally:
+        extractor.close()
+
+
+def extract_frames(uri, timestamps, workers=None, output="array", format="RGB"):
+    """Returns [(timestamp, frame)] in timestamp order.
+
+    With more than one worker, the sorted timestamps are cut into contiguous
+    runs, so each worker seeks within its own part of the file.
+    """
+    timestamps = sorted(timestamps)
+    workers = workers or os.cpu_count()
+    if workers <= 1 or len(timestamps) < 2 * workers:
+        return extract_chunk(uri, timestamps, output, format)
+
+    size = -(-len(timestamps) // workers)
+    chunks = [timestamps[i : i + size] for i in range(0, len(timestamps), size)]
+    # spawn: forking a process that already runs GStreamer threads is unsafe
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(len(chunks), context) as executor:
+        results = executor.map(
+            extract_chunk,
+            [uri] * len(chunks),
+            chunks,
+            [output] * len(chunks),
+            [format] * len(chunks),
+        )
+        return [frame for result in results for frame in result]
+
+
+def benchmark(uri, n_frames=200, restart_frames=20):
+    """Logs frames per second of the three strategies."""
+    probe = FrameExtractor(uri)
+    ret, duration = probe.pipeline.query_duration(Gst.Format.TIME)
+    probe.close()
+    timestamps = [i * duration // (n_frames + 1) for i in range(1, n_frames + 1)]
+
+    # a new pipeline per frame, as a bt04-style player would
+    start = time.perf_counter()
+    for timestamp in timestamps[:restart_frames]:
+        extractor = FrameExtractor(uri)
+        extractor.frame(timestamp)
+        extractor.close()
+    restart = restart_frames / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    extractor = FrameExtractor(uri)
+    list(extractor.frames(timestamps))
+    extractor.close()
+    single = n_frames / (time.perf_counter() - start)
+    logger.info(
+        f"Single pipeline: {extractor.seeks} seeks, {extractor.decoded} frames "
+        "decoded"
+    )
+
+    start = time.perf_counter()
+    extract_frames(uri, timestamps)
+    pooled = n_frames / (time.perf_counter() - start)
+
+    logger.info(
+        f"Frames per second: pipeline per frame {restart:.1f}, "
+        f"one pipeline {single:.1f}, {os.cpu_count()} workers {pooled:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    Gst.init(sys.argv)
+    uri = "file:///app/videos/street_5min.mp4"
+    if len(sys.argv) > 1:
+        uri = sys.argv[1]
+    benchmark(uri)
@@ -0,0 +1,67 @@
+"""
+Helpers for mapping Gst.Buffer memory from Python.
+
+Depending on whether the gst-python overrides are installed, `Gst.Buffer.map`
+either returns a `(success, Gst.MapInfo)` tuple whose `data` is a bytes copy,
+or a `Gst.MapInfo` whose `data` is a memoryview onto the buffer memory. These
+helpers hide that difference and tell the caller which one it got.
+"""
+
+import functools
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+
+def map_buffer(buffer, flags):
+    """Maps `buffer` and returns its Gst.MapInfo, raising on failure."""
+    result = buffer.map(flags)
+    if isinstance(result, tuple):
+        success, mapinfo = result
+        if not success:
+            raise RuntimeError("Could not map buffer")
+        return mapinfo
+    return result
+
+
+def is_direct(mapinfo, writable=False):
+    """True if `mapinfo.data` is a view onto the buffer memory (no copy)."""
+    data = mapinfo.data
+    if not isinstance(data, memoryview):
+        return False
+    return not (writable and data.readonly)
+
+
+@functools.lru_cache(maxsize=None)
+def has_direct_mapping():
+    """True if a WRITE mapping gives a writable view (gst-python overrides
+    installed), checked once on a one byte buffer."""
+    buffer = Gst.Buffer.new_allocate(None, 1, None)
+    mapinfo = map_buffer(buffer, Gst.MapFlags.WRITE)
+    try:
+        return is_direct(mapinfo, writable=True)
+    finally:
+        buffer.unmap(mapinfo)
+
+
+def write_buffer(buffer, data):
+    """Writes `data` (bytes or a C-contiguous NumPy array) at offset 0.
+
+    Writes in place through a writable mapping when one is available and
+    falls back to `Gst.Buffer.fill` otherwise, without mapping first (that
+    mapping would copy the whole buffer). Returns True if no intermediate
+    bytes object had to be created.
+    """
+    view = memoryview(data).cast("B")
+    if not has_direct_mapping():
+        buffer.fill(0, view.tobytes())
+        return False
+
+    mapinfo = map_buffer(buffer, Gst.MapFlags.WRITE)
+    try:
+        mapinfo.data[: view.nbytes] = view
+    finally:
+        buffer.unmap(mapinfo)
+    return True
@@ -0,0 +1,267 @@
+"""
+Persistent keyframe index for fast, accurate seeking.
+
+bt04 seeks with FLUSH | KEY_UNIT, which lands on whatever keyframe precedes
+the target, and bt13 uses ACCURATE seeks, which decode every frame from that
+keyframe up to the target each time. With the keyframe positions known up
+front, a seek can pick the cheapest mode for the precision it needs and
+knows how many frames it will have to decode.
+
+The index is built once per file by running the demuxer and parsers (no
+decoders) over the file and recording the timestamps of the non-delta video
+buffers. It is stored in a JSON sidecar cache, keyed by path, size and mtime,
+so later runs and other processes load it in milliseconds.
+
+Run this file with a path to build the index and compare seek latencies.
+"""
+
+import bisect
+import collections
+import hashlib
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "gst-keyframe-index",
+)
+
+SeekPlan = collections.namedtuple(
+    "SeekPlan", ["position", "flags", "keyframe", "decode_frames"]
+)
+
+
+def file_identity(path):
+    stat = os.stat(path)
+    return {
+        "path": os.path.abspath(path),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+    }
+
+
+def cache_path(path, cache_dir=CACHE_DIR):
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    return os.path.join(cache_dir, f"{digest}.json")
+
+
+class KeyframeIndex:
+    """Sorted keyframe timestamps (stream time, ns) of the first video
+    stream of a file."""
+
+    def __init__(self, keyframes, frame_duration, duration):
+        self.keyframes = keyframes
+        self.frame_duration = frame_duration
+        self.duration = duration
+
+    def previous(self, position):
+        """Last keyframe at or before `position`."""
+        i = bisect.bisect_right(self.keyframes, position)
+        return self.keyframes[max(i - 1, 0)]
+
+    def nearest(self, position):
+        i = bisect.bisect_left(self.keyframes, position)
+        candidates = self.keyframes[max(i - 1, 0) : i + 1]
+        return min(candidates, key=lambda keyframe: abs(keyframe - position))
+
+    def plan(self, position, tolerance=0):
+        """Returns the cheapest SeekPlan landing within `tolerance` ns of
+        `position`. `decode_frames` is the number of frames decoded and
+        dropped before the target frame can be shown."""
+        flush = Gst.SeekFlags.FLUSH
+        first = self.keyframes[0]
+        if position <= first:
+            # nothing can be shown before the first keyframe
+            return SeekPlan(first, flush | Gst.SeekFlags.KEY_UNIT, first, 0)
+        nearest = self.nearest(position)
+        # within half a frame of a keyframe, it is the target frame itself
+        if abs(nearest - position) <= max(tolerance, self.frame_duration // 2):
+            return SeekPlan(nearest, flush | Gst.SeekFlags.KEY_UNIT, nearest, 0)
+
+        keyframe = self.previous(position)
+        decode_frames = (position - keyframe) // self.frame_duration
+        return SeekPlan(
+            position, flush | Gst.SeekFlags.ACCURATE, keyframe, decode_frames
+        )
+
+    def seek(self, pipeline, position, tolerance=0):
+        """Seeks `pipeline` as planned by `plan()` and returns the plan."""
+        plan = self.plan(position, tolerance)
+        if not pipeline.seek_simple(Gst.Format.TIME, plan.flags, plan.position):
+            logger.error(f"Seek to {plan.position / Gst.SECOND:.3f}s failed")
+        return plan
+
+    def to_dict(self):
+        return {
+            "keyframes": self.keyframes,
+            "frame_duration": self.frame_duration,
+            "duration": self.duration,
+        }
+
+
+def scan_keyframes(path, timeout=120 * Gst.SECOND):
+    """Builds a KeyframeIndex by parsing (not decoding) the whole file."""
+    pipeline = Gst.Pipeline.new(None)
+    source = Gst.ElementFactory.make("filesrc", "source")
+    parser = Gst.ElementFactory.make("parsebin", "parser")
+    source.set_property("location", path)
+    pipeline.add(source)
+    pipeline.add(parser)
+    source.link(parser)
+
+    keyframes = []
+    state = {"segment": None, "frame_duration": Gst.SECOND // 30, "linked": False}
+
+    def on_buffer(pad, info):
+        if info.type & Gst.PadProbeType.BUFFER:
+            buffer = info.get_buffer()
+            if not buffer.has_flags(Gst.BufferFlags.DELTA_UNIT):
+                position = buffer.pts
+                if state["segment"] is not None and position != Gst.CLOCK_TIME_NONE:
+                    position = state["segment"].to_stream_time(
+                        Gst.Format.TIME, position
+                    )
+                if position != Gst.CLOCK_TIME_NONE:
+                    keyframes.append(position)
+        else:
+            event = info.get_event()
+            if event.type == Gst.EventType.SEGMENT:
+                state["segment"] = event.parse_segment().copy()
+            elif event.type == Gst.EventType.CAPS:
+                structure = event.parse_caps().get_structure(0)
+                ok, num, denom = structure.get_fraction("framerate")
+                if ok and num > 0:
+                    state["frame_duration"] = Gst.SECOND * denom // num
+        return Gst.PadProbeReturn.OK
+
+    def on_pad_added(src, new_pad):
+        # one fakesink per stream so every stream flows, probe the first video
+        sink = Gst.ElementFactory.make("fakesink", None)
+        sink.set_property("sync", False)
+        pipeline.add(sink)
+        sink.sync_state_with_parent()
+        new_pad.link(sink.get_static_pad("sink"))
+        name = new_pad.query_caps(None).get_structure(0).get_name()
+        if not state["linked"] and name.startswith("video/"):
+            state["linked"] = True
+            new_pad.add_probe(
+                Gst.PadProbeType.BUFFER | Gst.PadProbeType.EVENT_DOWNSTREAM, on_buffer
+            )
+
+    parser.connect("pad-added", on_pad_added)
+    start = time.perf_counter()
+    pipeline.set_state(Gst.State.PLAYING)
+    msg = pipeline.get_bus().timed_pop_filtered(
+        timeout, Gst.MessageType.ERROR | Gst.MessageType.EOS
+    )
+    ret, duration = pipeline.query_duration(Gst.Format.TIME)
+    pipeline.set_state(Gst.State.NULL)
+
+    if msg is None:
+        raise RuntimeError(f"Timed out scanning '{path}'")
+    if msg.type == Gst.MessageType.ERROR:
+        err, debug_info = msg.parse_error()
+        raise RuntimeError(f"Error scanning '{path}': {err.message}")
+    if not keyframes:
+        raise RuntimeError(f"No video keyframes found in '{path}'")
+
+    keyframes = sorted(set(keyframes))
+    logger.info(
+        f"Indexed {len(keyframes)} keyframes of '{path}' "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    return KeyframeIndex(
+        keyframes, state["frame_duration"], duration if ret else keyframes[-1]
+    )
+
+
+def load_index(path, cache_dir=CACHE_DIR):
+    """Returns the KeyframeIndex of `path` (a file path or file:// URI),
+    from the sidecar cache if it matches the file's size and mtime."""
+    if "://" in path:
+        path = Gst.uri_get_location(path)
+    identity = file_identity(path)
+    cached = cache_path(path, cache_dir)
+    try:
+        with open(cached) as f:
+            data = json.load(f)
+        if data["identity"] == identity:
+            return KeyframeIndex(
+                data["keyframes"], data["frame_duration"], data["duration"]
+            )
+        logger.info(f"Keyframe index of '{path}' is stale, rebuilding")
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index = scan_keyframes(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    # write and rename so concurrent readers never see a partial file
+    tmp = f"{cached}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"identity": identity, **index.to_dict()}, f)
+    os.replace(tmp, cached)
+    return index
+
+
+def benchmark(path, seeks=20, tolerance=Gst.SECOND // 2):
+    """Logs index load times and seek latencies with and without the index."""
+    start = time.perf_counter()
+    index = load_index(path)
+    logger.info(f"First load: {time.perf_counter() - start:.3f}s")
+    start = time.perf_counter()
+    index = load_index(path)
+    logger.info(f"Cached load: {1000 * (time.perf_counter() - start):.2f} ms")
+
+    pipeline = Gst.parse_launch(
+        f"playbin uri={Gst.filename_to_uri(path)} "
+        "video-sink=fakesink audio-sink=fakesink"
+    )
+    pipeline.set_state(Gst.State.PAUSED)
+    pipeline.get_state(Gst.CLOCK_TIME_NONE)
+    targets = [random.randrange(0, index.duration) for _ in range(seeks)]
+
+    def timed(seek):
+        times = []
+        for target in targets:
+            start = time.perf_counter()
+            seek(target)
+            pipeline.get_state(Gst.CLOCK_TIME_NONE)
+            times.append(time.perf_counter() - start)
+        return 1000 * statistics.median(times)
+
+    accurate_flags = Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE
+    accurate = timed(
+        lambda target: pipeline.seek_simple(Gst.Format.TIME, accurate_flags, target)
+    )
+    planned = timed(lambda target: index.seek(pipeline, target, tolerance))
+    pipeline.set_state(Gst.State.NULL)
+
+    frames = [index.plan(target, tolerance).decode_frames for target in targets]
+    logger.info(
+        f"Median seek latency: ACCURATE {accurate:.1f} ms, "
+        f"planned (tolerance {tolerance / Gst.SECOND:.1f}s) {planned:.1f} ms, "
+        f"{statistics.mean(frames):.1f} frames decoded per planned seek"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    Gst.init(sys.argv)
+    path = "/app/videos/street_5min.mp4"
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    benchmark(path)
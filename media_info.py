@@ -0,0 +1,233 @@
+"""
+Typed tag extraction and a compact media-info model.
+
+`parse_taglist` in bt09 used to serialize a Gst.TagList to a string and pick
+it apart with regexes, which turned every value into a string and broke on
+values containing commas. `taglist_to_dict()` walks the list natively
+(`n_tags` / `nth_tag_name` / `get_value_index`) and keeps ints, floats,
+booleans and strings as they are; dates become ISO 8601 strings and
+images/attachments a short description.
+
+MediaInfo is a `__slots__` record with the fields most libraries filter on,
+filled from a discovery record of batch_discovery.py (or the discovery
+cache). `to_columns()` turns many of them into NumPy arrays, one per field,
+and `write_csv()` writes the same columns as CSV.
+
+    python media_info.py library.jsonl --csv library.csv
+"""
+
+import argparse
+import csv
+import json
+import logging
+import sys
+
+import gi
+import numpy as np
+
+gi.require_version("Gst", "1.0")
+gi.require_version("GLib", "2.0")
+from gi.repository import GLib, Gst
+
+logger = logging.getLogger(__name__)
+
+
+def tag_value(value):
+    """A JSON-friendly, typed version of one tag value."""
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    if isinstance(value, Gst.DateTime):
+        return value.to_iso8601_string()
+    if isinstance(value, GLib.Date):
+        return (
+            f"{value.get_year():04d}-{int(value.get_month()):02d}-{value.get_day():02d}"
+        )
+    if isinstance(value, Gst.Sample):
+        # cover art and other attachments: describe instead of embedding
+        caps = value.get_caps()
+        buffer = value.get_buffer()
+        return {
+            "caps": caps.to_string() if caps else None,
+            "size": buffer.get_size() if buffer else 0,
+        }
+    return str(value)
+
+
+def taglist_to_dict(taglist):
+    """{tag name: value} of `taglist`, a list for multi-valued tags."""
+    tags = {}
+    for i in range(taglist.n_tags()):
+        name = taglist.nth_tag_name(i)
+        values = [
+            tag_value(taglist.get_value_index(name, j))
+            for j in range(taglist.get_tag_size(name))
+        ]
+        tags[name] = values[0] if len(values) == 1 else values
+    return tags
+
+
+def walk_streams(stream):
+    """Yields `stream` and all streams below it, depth first."""
+    if stream is None:
+        return
+    yield stream
+    for child in stream.get("children", []):
+        yield from walk_streams(child)
+
+
+def caps_structure(stream):
+    caps = stream.get("caps")
+    if not caps:
+        return None
+    caps = Gst.Caps.from_string(caps)
+    return caps.get_structure(0) if caps and caps.get_size() else None
+
+
+class MediaInfo:
+    """The commonly queried facts about one media file."""
+
+    __slots__ = (
+        "uri",
+        "result",
+        "duration",
+        "seekable",
+        "container",
+        "video_codec",
+        "width",
+        "height",
+        "framerate",
+        "audio_codec",
+        "channels",
+        "sample_rate",
+        "bitrate",
+        "title",
+        "tags",
+    )
+
+    # columns of `to_columns()`: (field, NumPy dtype, missing value)
+    COLUMNS = (
+        ("uri", object, ""),
+        ("result", object, ""),
+        ("duration", np.float64, np.nan),
+        ("seekable", np.bool_, False),
+        ("container", object, ""),
+        ("video_codec", object, ""),
+        ("width", np.int32, -1),
+        ("height", np.int32, -1),
+        ("framerate", np.float64, np.nan),
+        ("audio_codec", object, ""),
+        ("channels", np.int32, -1),
+        ("sample_rate", np.int32, -1),
+        ("bitrate", np.int64, -1),
+        ("title", object, ""),
+    )
+
+    def __init__(self, uri, result="ok"):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        self.uri = uri
+        self.result = result
+        self.tags = {}
+
+    @classmethod
+    def from_record(cls, record):
+        """Builds a MediaInfo from a batch_discovery record."""
+        info = cls(record["uri"], record["result"])
+        if record.get("duration") is not None:
+            info.duration = record["duration"] / Gst.SECOND
+        info.seekable = record.get("seekable")
+        info.tags = record.get("tags") or {}
+        info.title = info.tags.get(Gst.TAG_TITLE)
+        bitrate = info.tags.get(Gst.TAG_BITRATE)
+        info.bitrate = bitrate if isinstance(bitrate, int) else None
+
+        for stream in walk_streams(record.get("streams")):
+            kind = stream["type"]
+            if kind == "container" and info.container is None:
+                info.container = stream["description"]
+            elif kind == "video" and info.video_codec is None:
+                info.video_codec = stream["description"]
+                structure = caps_structure(stream)
+                if structure is not None:
+                    info.width = structure.get_int("width")[1] or None
+                    info.height = structure.get_int("height")[1] or None
+                    ok, num, denom = structure.get_fraction("framerate")
+                    info.framerate = num / denom if ok and denom else None
+            elif kind == "audio" and info.audio_codec is None:
+                info.audio_codec = stream["description"]
+                structure = caps_structure(stream)
+                if structure is not None:
+                    info.channels = structure.get_int("channels")[1] or None
+                    info.sample_rate = structure.get_int("rate")[1] or None
+        return info
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def to_columns(infos):
+    """{field: NumPy array} over `infos`, missing values as NaN, -1 or ""."""
+    infos = list(infos)
+    columns = {}
+    for name, dtype, missing in MediaInfo.COLUMNS:
+        values = [getattr(info, name) for info in infos]
+        columns[name] = np.array(
+            [missing if value is None else value for value in values], dtype=dtype
+        )
+    return columns
+
+
+def write_csv(infos, path):
+    names = [name for name, dtype, missing in MediaInfo.COLUMNS]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        for info in infos:
+            writer.writerow(
+                [
+                    "" if getattr(info, name) is None else getattr(info, name)
+                    for name in names
+                ]
+            )
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield MediaInfo.from_record(json.loads(line))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("jsonl", help="output of batch_discovery.py")
+    parser.add_argument("--csv", help="write the columns as CSV")
+    args = parser.parse_args()
+
+    Gst.init(None)
+    infos = list(read_jsonl(args.jsonl))
+    columns = to_columns(infos)
+    ok = columns["result"] == "ok"
+    logger.info(f"{len(infos)} files, {ok.sum()} discovered")
+    if ok.any():
+        logger.info(
+            f"Total duration: {np.nansum(columns['duration'][ok]) / 3600:.2f} h"
+        )
+        heights = columns["height"][ok & (columns["height"] > 0)]
+        if len(heights):
+            values, counts = np.unique(heights, return_counts=True)
+            logger.info(
+                "Video heights: "
+                + ", ".join(f"{v}p x{c}" for v, c in zip(values, counts))
+            )
+    if args.csv:
+        write_csv(infos, args.csv)
+        logger.info(f"Wrote {args.csv}")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    sys.exit(main())
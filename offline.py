@@ -0,0 +1,196 @@
+"""
+As-fast-as-possible offline processing for file pipelines.
+
+The file-based tutorials (bt01, bt03, bt04, bt13) play at realtime because
+their display and audio sinks synchronize every buffer against the clock.
+`make_offline()` turns any of those pipelines into a batch job before it is
+started:
+
+- playbin / playbin3 get `fakesink sync=false` (or appsink) as video and
+  audio sink, and can skip audio decoding altogether,
+- any other pipeline gets its display and audio sinks (`autovideosink`,
+  `autoaudiosink`, `xvimagesink`, `pulsesink`, ...) replaced in place, and
+  every remaining sink (appsink, filesink, fakesink) stops syncing.
+
+`run_offline()` then plays the pipeline to EOS and reports the speed-up over
+realtime. The tutorial objects can be passed directly, e.g.
+`make_offline(Player().playbin)` for bt04 or `make_offline(Player().pipeline)`
+for bt03.
+
+Run this file with `playbin` (bt01) or `decodebin` (bt03) and an optional URI.
+"""
+
+import collections
+import logging
+import sys
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+from preroll_pool import build_decode_pipeline
+from tee_branches import iterate
+
+logger = logging.getLogger(__name__)
+
+# GstPlayFlags of playbin, not exposed through introspection
+PLAY_FLAG_AUDIO = 1 << 1
+
+OfflineResult = collections.namedtuple(
+    "OfflineResult", ["wall_time", "media_duration", "speedup", "error"]
+)
+
+
+def element_klass(element):
+    factory = element.get_factory()
+    if factory is None:
+        return ""
+    return factory.get_metadata("klass") or ""
+
+
+def is_render_sink(element):
+    """True for sinks that present media to a display or sound card."""
+    klass = element_klass(element)
+    return "Sink" in klass and ("Video" in klass or "Audio" in klass)
+
+
+def make_offline_sink(sink, name=None):
+    """`fakesink` or `appsink` that never waits for the clock."""
+    element = Gst.ElementFactory.make(sink, name)
+    if element is None:
+        raise RuntimeError(f"Could not create '{sink}' element")
+    element.set_property("sync", False)
+    return element
+
+
+def replace_sink(old, sink="fakesink"):
+    """Swaps `old` for an unsynchronized `sink` at the same place in its bin.
+
+    Works for sinks linked to a peer element as well as for sinks behind a
+    ghost pad (e.g. the bins of `build_decode_pipeline`). The pipeline must
+    not be running.
+    """
+    parent = old.get_parent()
+    old_pad = old.get_static_pad("sink")
+    ghost = None
+    for pad in iterate(parent.iterate_sink_pads()):
+        if isinstance(pad, Gst.GhostPad) and pad.get_target() == old_pad:
+            ghost = pad
+            break
+    peer = old_pad.get_peer() if ghost is None else None
+    if peer is not None:
+        peer.unlink(old_pad)
+
+    name = old.get_name()
+    old.set_state(Gst.State.NULL)
+    parent.remove(old)
+
+    new = make_offline_sink(sink, name)
+    parent.add(new)
+    new_pad = new.get_static_pad("sink")
+    if ghost is not None:
+        ghost.set_target(new_pad)
+    elif peer is not None and peer.link(new_pad) != Gst.PadLinkReturn.OK:
+        raise RuntimeError(f"Could not link {sink} in place of '{name}'")
+    logger.info(f"Replaced sink '{name}' with {sink} sync=false")
+    return new
+
+
+def make_offline(pipeline, sink="fakesink", audio=True):
+    """Makes `pipeline` run as fast as its elements can process data.
+
+    `sink` is "fakesink" to discard the output or "appsink" to pull it (the
+    sinks keep their names, "video_sink" and "audio_sink" for playbin).
+    With `audio=False`, playbin does not decode audio at all. Returns the
+    new sinks. Call before setting the pipeline to PAUSED or PLAYING.
+    """
+    factory = pipeline.get_factory()
+    if factory is not None and factory.get_name() in ("playbin", "playbin3"):
+        sinks = []
+        for kind in ("video", "audio"):
+            element = make_offline_sink(sink, f"{kind}_sink")
+            pipeline.set_property(f"{kind}-sink", element)
+            sinks.append(element)
+        if not audio:
+            flags = int(pipeline.get_property("flags"))
+            pipeline.set_property("flags", flags & ~PLAY_FLAG_AUDIO)
+            logger.info("Audio decoding disabled")
+        return sinks
+
+    # only replace the outermost render sinks: the children of an
+    # autovideosink are gone with it
+    candidates = [
+        element
+        for element in iterate(pipeline.iterate_recurse())
+        if is_render_sink(element)
+    ]
+    render_sinks = [
+        element
+        for element in candidates
+        if not any(element.has_as_ancestor(other) for other in candidates)
+    ]
+    sinks = [replace_sink(element, sink) for element in render_sinks]
+
+    for element in iterate(pipeline.iterate_recurse()):
+        if (
+            "Sink" in element_klass(element)
+            and element.find_property("sync") is not None
+        ):
+            element.set_property("sync", False)
+    return sinks
+
+
+def run_offline(pipeline):
+    """Plays `pipeline` to EOS and returns an OfflineResult."""
+    start = time.perf_counter()
+    pipeline.set_state(Gst.State.PLAYING)
+    msg = pipeline.get_bus().timed_pop_filtered(
+        Gst.CLOCK_TIME_NONE, Gst.MessageType.ERROR | Gst.MessageType.EOS
+    )
+    wall = time.perf_counter() - start
+
+    error = None
+    if msg.type == Gst.MessageType.ERROR:
+        err, debug_info = msg.parse_error()
+        error = f"Error received from element {msg.src.get_name()}: {err.message}"
+        logger.error(error)
+
+    # at EOS the position is the end of the media, which also covers files
+    # whose container does not state a duration
+    duration = None
+    for query in (pipeline.query_duration, pipeline.query_position):
+        ret, value = query(Gst.Format.TIME)
+        if ret and value > 0:
+            duration = value / Gst.SECOND
+            break
+    pipeline.set_state(Gst.State.NULL)
+
+    speedup = duration / wall if duration and wall else None
+    if speedup is not None:
+        logger.info(
+            f"Processed {duration:.1f}s of media in {wall:.2f}s "
+            f"({speedup:.1f}x realtime)"
+        )
+    return OfflineResult(wall, duration, speedup, error)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    Gst.init(sys.argv)
+    mode = sys.argv[1] if len(sys.argv) > 1 else "playbin"
+    uri = "file:///app/videos/street_5min.mp4"
+    if len(sys.argv) > 2:
+        uri = sys.argv[2]
+
+    if mode == "playbin":
+        pipeline = Gst.parse_launch(f"playbin uri={uri}")
+    elif mode == "decodebin":
+        pipeline = build_decode_pipeline(uri)
+    else:
+        raise SystemExit(f"Unknown mode '{mode}', use 'playbin' or 'decodebin'")
+    make_offline(pipeline)
+    run_offline(pipeline)
@@ -0,0 +1,232 @@
+"""
+Headless benchmark suite for the tutorial pipelines.
+
+Each entry rebuilds the topology of a tutorial with `videotestsrc` /
+`audiotestsrc` (bounded by `num-buffers`) instead of files and devices, and
+`fakesink sync=false` instead of `autovideosink` / `autoaudiosink`, so it runs
+without a display or sound card and as fast as the machine allows. Playbin
+based tutorials are modelled by the raw video and audio branches playbin
+builds after decoding.
+
+Every benchmark runs in its own process, so peak RSS is per pipeline. Results
+are written as JSON and can be compared with a stored baseline:
+
+    python pipeline_bench.py --output results.json
+    python pipeline_bench.py --baseline results.json --tolerance 0.15
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+logger = logging.getLogger(__name__)
+
+VIDEO_SRC = "videotestsrc num-buffers={n} ! video/x-raw,width=640,height=360"
+AUDIO_SRC = "audiotestsrc num-buffers={n}"
+PLAYBIN_BRANCHES = (
+    f"{VIDEO_SRC} ! videoconvert ! fakesink sync=false "
+    f"{AUDIO_SRC} ! audioconvert ! audioresample ! fakesink sync=false"
+)
+
+BENCHMARKS = {
+    "bt01_hello_world": PLAYBIN_BRANCHES,
+    "bt02_gstreamer_concepts": (
+        "videotestsrc num-buffers={n} pattern=ball ! vertigotv ! videoconvert ! "
+        "fakesink sync=false"
+    ),
+    "bt03_dynamic_pipelines": (
+        f"{VIDEO_SRC} ! videoconvert ! fakesink sync=false "
+        f"{AUDIO_SRC} ! audioconvert ! fakesink sync=false"
+    ),
+    "bt04_time_management": PLAYBIN_BRANCHES,
+    "bt05_gui_toolkit_integration": PLAYBIN_BRANCHES,
+    "bt06_media_formats_and_pad_capabilities": f"{AUDIO_SRC} ! fakesink sync=false",
+    "bt07_multithreading_and_pad_availability": (
+        "audiotestsrc num-buffers={n} freq=215 ! tee name=tee "
+        "tee. ! queue ! audioconvert ! audioresample ! fakesink sync=false "
+        "tee. ! queue ! wavescope shader=0 style=1 ! videoconvert ! "
+        "fakesink sync=false"
+    ),
+    "bt08_short_cutting_the_pipeline": (
+        "audiotestsrc num-buffers={n} ! audio/x-raw,format=S16LE,channels=1,"
+        "rate=44100 ! tee name=tee "
+        "tee. ! queue ! audioconvert ! audioresample ! fakesink sync=false "
+        "tee. ! queue ! audioconvert ! wavescope shader=0 style=0 ! "
+        "videoconvert ! fakesink sync=false "
+        "tee. ! queue ! appsink sync=false"
+    ),
+    "bt11_debugging_tools": (
+        "videotestsrc num-buffers={n} pattern=ball ! vertigotv ! videoconvert ! "
+        "fakesink sync=false"
+    ),
+    "bt12_streaming": PLAYBIN_BRANCHES,
+    "bt13_playback_speed": PLAYBIN_BRANCHES,
+}
+
+# metric: True if higher is better
+METRICS = {
+    "fps": True,
+    "cpu_time": False,
+    "peak_rss_kb": False,
+    "time_to_playing": False,
+}
+
+
+def run_benchmark(description, num_buffers):
+    """Runs one pipeline to EOS in this process and returns its metrics."""
+    pipeline = Gst.parse_launch(description.format(n=num_buffers))
+    bus = pipeline.get_bus()
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_start = usage.ru_utime + usage.ru_stime
+    start = time.perf_counter()
+    pipeline.set_state(Gst.State.PLAYING)
+
+    time_to_playing = None
+    error = None
+    while True:
+        msg = bus.timed_pop_filtered(
+            Gst.CLOCK_TIME_NONE,
+            Gst.MessageType.STATE_CHANGED | Gst.MessageType.ERROR | Gst.MessageType.EOS,
+        )
+        if msg.type == Gst.MessageType.STATE_CHANGED:
+            if msg.src == pipeline and time_to_playing is None:
+                old, new, pending = msg.parse_state_changed()
+                if new == Gst.State.PLAYING:
+                    time_to_playing = time.perf_counter() - start
+            continue
+        if msg.type == Gst.MessageType.ERROR:
+            err, debug_info = msg.parse_error()
+            error = f"{msg.src.get_name()}: {err.message}"
+        break
+
+    wall = time.perf_counter() - start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    pipeline.set_state(Gst.State.NULL)
+
+    return {
+        "error": error,
+        "wall_time": wall,
+        "fps": num_buffers / wall,
+        "cpu_time": usage.ru_utime + usage.ru_stime - cpu_start,
+        # kilobytes on Linux
+        "peak_rss_kb": usage.ru_maxrss,
+        "time_to_playing": time_to_playing,
+    }
+
+
+def run_in_subprocess(name, num_buffers):
+    proc = subprocess.run(
+        [sys.executable, __file__, "--child", name, "--num-buffers", str(num_buffers)],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        return {"error": (proc.stderr.strip().splitlines() or ["crashed"])[-1]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    """Returns a list of regressions of `results` against `baseline`."""
+    regressions = []
+    for name, metrics in results.items():
+        reference = baseline.get("benchmarks", {}).get(name)
+        if not reference or metrics.get("error") or reference.get("error"):
+            continue
+        for metric, higher_is_better in METRICS.items():
+            value, expected = metrics.get(metric), reference.get(metric)
+            if value is None or not expected:
+                continue
+            change = (value - expected) / expected
+            if (higher_is_better and change < -tolerance) or (
+                not higher_is_better and change > tolerance
+            ):
+                regressions.append(
+                    f"{name} {metric}: {expected:.4g} -> {value:.4g} ({change:+.1%})"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--num-buffers", type=int, default=1000)
+    parser.add_argument("--only", nargs="*", help="benchmark names to run")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        Gst.init(None)
+        metrics = run_benchmark(BENCHMARKS[args.child], args.num_buffers)
+        print(json.dumps(metrics))
+        return 0
+
+    # read the baseline before anything is written, it may be the previous
+    # run's output
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    names = args.only or list(BENCHMARKS)
+    results = {}
+    for name in names:
+        results[name] = run_in_subprocess(name, args.num_buffers)
+        metrics = results[name]
+        if metrics.get("error"):
+            logger.error(f"{name}: {metrics['error']}")
+        else:
+            logger.info(
+                f"{name}: {metrics['fps']:,.0f} buffers/s, "
+                f"CPU {metrics['cpu_time']:.2f}s, "
+                f"peak RSS {metrics['peak_rss_kb'] / 1024:.1f} MB, "
+                f"PLAYING after {1000 * (metrics['time_to_playing'] or 0):.1f} ms"
+            )
+
+    Gst.init(None)
+    report = {
+        "gstreamer": Gst.version_string(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "num_buffers": args.num_buffers,
+        "benchmarks": results,
+    }
+    if args.baseline and os.path.realpath(args.output) == os.path.realpath(
+        args.baseline
+    ):
+        logger.warning(
+            f"Not saving results, {args.output} is the baseline (pass another --output)"
+        )
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Saved results to {args.output}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            return 1
+        logger.info("No regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+A pool of prerolled pipelines for instant playback start.
+
+`Player` in bt03_dynamic_pipelines.py only builds and negotiates its
+uridecodebin pipeline when `play()` is called, so typefinding, demuxer and
+decoder setup and preroll all count towards time-to-first-frame.
+PrerolledPool keeps a few pipelines per expected URI (or any other key, such
+as a caps profile with its own factory) waiting in PAUSED, hands one out on
+demand and builds a replacement on a background thread.
+
+Run this file with a URI to compare time-to-first-frame with and without the
+pool.
+"""
+
+import collections
+import logging
+import queue
+import statistics
+import sys
+import threading
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+logger = logging.getLogger(__name__)
+
+
+def build_decode_pipeline(uri, video_sink="autovideosink", audio_sink="autoaudiosink"):
+    """Builds the bt03 topology: uridecodebin linked on pad-added to
+    videoconvert ! <video_sink> and audioconvert ! <audio_sink>."""
+    pipeline = Gst.Pipeline.new(None)
+    source = Gst.ElementFactory.make("uridecodebin", "source")
+    video_convert = Gst.ElementFactory.make("videoconvert", "video_convert")
+    audio_convert = Gst.ElementFactory.make("audioconvert", "audio_convert")
+    video = Gst.parse_bin_from_description(video_sink, True)
+    audio = Gst.parse_bin_from_description(audio_sink, True)
+    for element in (source, video_convert, video, audio_convert, audio):
+        pipeline.add(element)
+    video_convert.link(video)
+    audio_convert.link(audio)
+    source.set_property("uri", uri)
+
+    def on_pad_added(src, new_pad):
+        new_pad_type = new_pad.get_current_caps().get_structure(0).get_name()
+        if new_pad_type.startswith("audio/x-raw"):
+            sink_pad = audio_convert.get_static_pad("sink")
+        else:
+            sink_pad = video_convert.get_static_pad("sink")
+        if not sink_pad.is_linked():
+            new_pad.link(sink_pad)
+
+    def on_no_more_pads(src):
+        # drop the branch the media has no stream for, otherwise its sink
+        # would never preroll
+        for convert, sink in ((video_convert, video), (audio_convert, audio)):
+            if not convert.get_static_pad("sink").is_linked():
+                for element in (convert, sink):
+                    element.set_locked_state(True)
+                    element.set_state(Gst.State.NULL)
+                    pipeline.remove(element)
+
+    source.connect("pad-added", on_pad_added)
+    source.connect("no-more-pads", on_no_more_pads)
+    return pipeline
+
+
+def preroll(pipeline, timeout=10 * Gst.SECOND):
+    """Sets `pipeline` to PAUSED and waits for preroll. Returns success."""
+    if pipeline.set_state(Gst.State.PAUSED) == Gst.StateChangeReturn.FAILURE:
+        return False
+    ret, state, pending = pipeline.get_state(timeout)
+    return ret in (Gst.StateChangeReturn.SUCCESS, Gst.StateChangeReturn.NO_PREROLL)
+
+
+def wait_playing(pipeline, timeout=10 * Gst.SECOND):
+    """Sets `pipeline` to PLAYING and returns the seconds it took to get
+    there, i.e. until the first frame reached the sinks, or None on error."""
+    start = time.perf_counter()
+    if pipeline.set_state(Gst.State.PLAYING) == Gst.StateChangeReturn.FAILURE:
+        return None
+    ret, state, pending = pipeline.get_state(timeout)
+    if ret == Gst.StateChangeReturn.FAILURE:
+        return None
+    return time.perf_counter() - start
+
+
+class PrerolledPool:
+    """Keeps up to `size` pipelines per key prerolled in PAUSED.
+
+    `factory(key)` builds an unstarted pipeline; by default keys are URIs
+    and pipelines use the bt03 topology. Pipelines handed out by `acquire()`
+    belong to the caller, who sets them to PLAYING and later to NULL.
+    """
+
+    def __init__(self, size=2, factory=build_decode_pipeline):
+        self.size = size
+        self.factory = factory
+        self.ready = collections.defaultdict(collections.deque)
+        self.lock = threading.Lock()
+        self.refills = queue.Queue()
+        self.hits = 0
+        self.misses = 0
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.refill_loop, name="preroll-pool")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def warm(self, key, factory=None):
+        """Starts prerolling pipelines for `key` in the background."""
+        for _ in range(self.size):
+            self.refills.put((key, factory or self.factory))
+
+    def acquire(self, key, factory=None):
+        """Returns a pipeline for `key`, prerolled if the pool had one."""
+        factory = factory or self.factory
+        with self.lock:
+            pipelines = self.ready[key]
+            pipeline = pipelines.popleft() if pipelines else None
+        # build a replacement for the next request
+        self.refills.put((key, factory))
+
+        if pipeline is not None:
+            self.hits += 1
+            return pipeline
+        self.misses += 1
+        logger.info(f"No prerolled pipeline for '{key}', building one")
+        return factory(key)
+
+    def refill_loop(self):
+        while not self.stopping.is_set():
+            try:
+                key, factory = self.refills.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            with self.lock:
+                if len(self.ready[key]) >= self.size:
+                    continue
+
+            pipeline = factory(key)
+            if not preroll(pipeline):
+                logger.error(f"Could not preroll a pipeline for '{key}'")
+                pipeline.set_state(Gst.State.NULL)
+                continue
+            with self.lock:
+                self.ready[key].append(pipeline)
+
+    def wait_ready(self, key, count=1, timeout=30.0):
+        """Blocks until `count` pipelines for `key` are prerolled."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if len(self.ready[key]) >= count:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+        with self.lock:
+            for pipelines in self.ready.values():
+                for pipeline in pipelines:
+                    pipeline.set_state(Gst.State.NULL)
+            self.ready.clear()
+        logger.info(f"Preroll pool: {self.hits} hits, {self.misses} misses")
+
+
+def benchmark(uri, runs=5):
+    """Logs time-to-first-frame for fresh and pooled pipelines."""
+
+    def factory(uri):
+        return build_decode_pipeline(uri, "fakesink sync=true", "fakesink sync=true")
+
+    cold = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        pipeline = factory(uri)
+        if wait_playing(pipeline) is not None:
+            cold.append(time.perf_counter() - start)
+        pipeline.set_state(Gst.State.NULL)
+
+    pool = PrerolledPool(size=1, factory=factory)
+    pool.warm(uri)
+    pooled = []
+    for _ in range(runs):
+        pool.wait_ready(uri)
+        start = time.perf_counter()
+        pipeline = pool.acquire(uri)
+        if wait_playing(pipeline) is not None:
+            pooled.append(time.perf_counter() - start)
+        pipeline.set_state(Gst.State.NULL)
+    pool.stop()
+
+    for label, times in (("without pool", cold), ("with pool", pooled)):
+        if times:
+            logger.info(
+                f"Time to first frame {label}: "
+                f"median {1000 * statistics.median(times):.1f} ms, "
+                f"max {1000 * max(times):.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    Gst.init(sys.argv)
+    uri = "file:///app/videos/chime_2min.mp4"
+    if len(sys.argv) > 1:
+        uri = sys.argv[1]
+    benchmark(uri)
@@ -0,0 +1,255 @@
+"""
+Push-based position and progress reporting.
+
+bt04 queries the position every 100 ms and bt05 queries duration and position
+every second. Every query walks the pipeline down to the sinks and back, which
+adds up over hundreds of monitored pipelines. ProgressTracker instead:
+
+- reads the running position from the timestamps of the buffers reaching a
+  sink pad (a pad probe that only stores the last timestamp),
+- queries the duration once and keeps it until a DURATION_CHANGED message,
+- pushes Progress updates to subscribers, each at its own maximum rate.
+
+Updates are delivered on the streaming thread from the probe, so callbacks
+must return quickly (hand off with `GLib.idle_add` or
+`loop.call_soon_threadsafe`). No thread or timer is needed per pipeline.
+
+Run this file to compare the CPU cost of query polling with push updates over
+many pipelines.
+"""
+
+import collections
+import logging
+import resource
+import sys
+import threading
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+gi.require_version("GstBase", "1.0")
+from gi.repository import Gst, GstBase
+
+from tee_branches import iterate
+
+logger = logging.getLogger(__name__)
+
+Progress = collections.namedtuple("Progress", ["position", "duration", "fraction"])
+
+
+class Subscriber:
+    def __init__(self, callback, interval):
+        self.callback = callback
+        self.interval = interval
+        self.next_due = 0.0
+        self.last_position = None
+
+
+class ProgressTracker:
+    """Tracks the position of `pipeline` from buffer timestamps.
+
+    The probe goes on `pad` if given, otherwise on the sink pad of the first
+    GstBase.BaseSink added anywhere in the pipeline (which also finds the sinks
+    playbin creates while prerolling). Positions and durations are in
+    nanoseconds, like `query_position`.
+    """
+
+    def __init__(self, pipeline, pad=None):
+        self.pipeline = pipeline
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.next_due = float("inf")
+        self.segment = None
+        self.pts = Gst.CLOCK_TIME_NONE
+        self.duration = None
+        self.duration_valid = False
+        self.pad = None
+        self.probe_id = None
+
+        bus = pipeline.get_bus()
+        bus.enable_sync_message_emission()
+        self.bus_handler = bus.connect(
+            "sync-message::duration-changed", self.on_duration_changed
+        )
+        self.element_handler = None
+        if pad is None:
+            self.element_handler = pipeline.connect(
+                "deep-element-added", self.on_deep_element_added
+            )
+            pad = next(
+                (
+                    element.get_static_pad("sink")
+                    for element in iterate(pipeline.iterate_recurse())
+                    if isinstance(element, GstBase.BaseSink)
+                ),
+                None,
+            )
+        if pad is not None:
+            self.attach(pad)
+
+    def on_deep_element_added(self, bin, sub_bin, element):
+        if self.pad is None and isinstance(element, GstBase.BaseSink):
+            self.attach(element.get_static_pad("sink"))
+
+    def attach(self, pad):
+        with self.lock:
+            if self.pad is not None:
+                return
+            self.pad = pad
+        self.probe_id = pad.add_probe(
+            Gst.PadProbeType.BUFFER | Gst.PadProbeType.EVENT_DOWNSTREAM,
+            self.on_pad_probe,
+        )
+        logger.debug(f"Tracking progress on {pad.get_parent().get_name()}")
+
+    def on_duration_changed(self, bus, msg):
+        self.duration_valid = False
+
+    def on_pad_probe(self, pad, info):
+        if info.type & Gst.PadProbeType.BUFFER:
+            self.pts = info.get_buffer().pts
+            if time.monotonic() >= self.next_due:
+                self.publish()
+        else:
+            event = info.get_event()
+            if event.type == Gst.EventType.SEGMENT:
+                self.segment = event.parse_segment().copy()
+            elif event.type == Gst.EventType.FLUSH_STOP:
+                self.pts = Gst.CLOCK_TIME_NONE
+        return Gst.PadProbeReturn.OK
+
+    def position(self):
+        """Stream time of the last buffer seen, or None."""
+        pts, segment = self.pts, self.segment
+        if pts == Gst.CLOCK_TIME_NONE or segment is None:
+            return None
+        position = segment.to_stream_time(Gst.Format.TIME, pts)
+        return None if position == Gst.CLOCK_TIME_NONE else position
+
+    def get_duration(self):
+        """Cached duration, queried again after DURATION_CHANGED."""
+        if not self.duration_valid:
+            # set first so a DURATION_CHANGED during the query wins
+            self.duration_valid = True
+            ret, duration = self.pipeline.query_duration(Gst.Format.TIME)
+            self.duration = duration if ret and duration >= 0 else None
+        return self.duration
+
+    def progress(self):
+        position = self.position()
+        duration = self.get_duration()
+        fraction = None
+        if position is not None and duration:
+            fraction = min(position / duration, 1.0)
+        return Progress(position, duration, fraction)
+
+    def subscribe(self, callback, rate=10.0):
+        """Calls `callback(progress)` at most `rate` times per second, and
+        only when the position moved. Returns a handle for `unsubscribe`."""
+        subscriber = Subscriber(callback, 1.0 / rate)
+        with self.lock:
+            self.subscribers.append(subscriber)
+            self.next_due = 0.0
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.remove(subscriber)
+            self.next_due = min(
+                (s.next_due for s in self.subscribers), default=float("inf")
+            )
+
+    def publish(self):
+        now = time.monotonic()
+        with self.lock:
+            due = [s for s in self.subscribers if now >= s.next_due]
+            for subscriber in due:
+                subscriber.next_due = now + subscriber.interval
+            self.next_due = min(
+                (s.next_due for s in self.subscribers), default=float("inf")
+            )
+        if not due:
+            return
+
+        progress = self.progress()
+        if progress.position is None:
+            return
+        for subscriber in due:
+            if progress.position != subscriber.last_position:
+                subscriber.last_position = progress.position
+                subscriber.callback(progress)
+
+    def close(self):
+        if self.probe_id is not None:
+            self.pad.remove_probe(self.probe_id)
+            self.probe_id = None
+        if self.element_handler is not None:
+            self.pipeline.disconnect(self.element_handler)
+            self.element_handler = None
+        self.pipeline.get_bus().disconnect(self.bus_handler)
+
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def benchmark(n_pipelines=200, seconds=5.0, rate=10.0):
+    """Logs the CPU cost of polling n pipelines with queries vs push updates."""
+    description = "videotestsrc is-live=true ! video/x-raw,framerate=30/1 ! fakesink"
+
+    def run(mode):
+        pipelines = [Gst.parse_launch(description) for _ in range(n_pipelines)]
+        updates = [0]
+        trackers = []
+
+        def on_progress(progress):
+            updates[0] += 1
+
+        if mode == "push":
+            for pipeline in pipelines:
+                tracker = ProgressTracker(pipeline)
+                tracker.subscribe(on_progress, rate)
+                trackers.append(tracker)
+        for pipeline in pipelines:
+            pipeline.set_state(Gst.State.PLAYING)
+        for pipeline in pipelines:
+            pipeline.get_state(Gst.CLOCK_TIME_NONE)
+
+        start_cpu = cpu_time()
+        deadline = time.monotonic() + seconds
+        if mode == "poll":
+            # the bt04 loop, for every pipeline
+            while time.monotonic() < deadline:
+                for pipeline in pipelines:
+                    ret, position = pipeline.query_position(Gst.Format.TIME)
+                    ret, duration = pipeline.query_duration(Gst.Format.TIME)
+                    on_progress(Progress(position, duration, None))
+                time.sleep(1.0 / rate)
+        else:
+            time.sleep(seconds)
+        cpu = cpu_time() - start_cpu
+
+        for tracker in trackers:
+            tracker.close()
+        for pipeline in pipelines:
+            pipeline.set_state(Gst.State.NULL)
+        return cpu, updates[0]
+
+    baseline_cpu, _ = run("none")
+    for mode in ("poll", "push"):
+        cpu, updates = run(mode)
+        extra = cpu - baseline_cpu
+        logger.info(
+            f"{mode}: {updates} updates, {extra:.3f}s CPU over streaming alone "
+            f"({1e6 * extra / max(updates, 1):.1f} us per update)"
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    Gst.init(sys.argv)
+    benchmark()
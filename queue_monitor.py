@@ -0,0 +1,215 @@
+"""
+Backpressure monitoring for the `queue`-fronted tee branches used in
+bt07_multithreading_and_pad_availability.py and
+bt08_short_cutting_the_pipeline.py.
+
+A slow branch (e.g. wavescope ! videoconvert) fills its queue, and a full
+non-leaky queue blocks the tee for every other branch. QueueMonitor samples
+`current-level-buffers/bytes/time` of each queue from a helper thread.
+
+Full queues alone are normal: with a non-live source in front of clock-synced
+sinks every tee queue is full in steady state. A branch is only considered
+to hold the others back when it stays saturated while the critical branch is
+starving (its queue is almost empty or posts `underrun`). It is then only
+reported ("observe", the default), its queue is switched to
+`leaky=downstream` ("leaky"), or a share of the buffers leaving it is dropped
+("throttle"). The critical branch is never touched, and without one no
+branch is relieved.
+"""
+
+import logging
+import threading
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+from tee_branches import iterate
+
+logger = logging.getLogger(__name__)
+
+LEVEL_PROPERTIES = [
+    ("current-level-buffers", "max-size-buffers"),
+    ("current-level-bytes", "max-size-bytes"),
+    ("current-level-time", "max-size-time"),
+]
+
+
+class BranchStats:
+    """Fill and drop statistics of one queue."""
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.name = queue.get_name()
+        self.samples = 0
+        self.fill = 0.0
+        self.fill_sum = 0.0
+        self.max_fill = 0.0
+        self.saturated_samples = 0
+        self.saturated_run = 0
+        self.overruns = 0
+        self.underruns = 0
+        self.drops = 0
+        self.action = None
+        self.throttle_count = 0
+
+    def as_dict(self):
+        return {
+            "fill": self.fill,
+            "mean_fill": self.fill_sum / self.samples if self.samples else 0.0,
+            "max_fill": self.max_fill,
+            "saturated_ratio": (
+                self.saturated_samples / self.samples if self.samples else 0.0
+            ),
+            "overruns": self.overruns,
+            "underruns": self.underruns,
+            "drops": self.drops,
+            "action": self.action,
+        }
+
+
+class QueueMonitor:
+    """Samples queue fill levels and relieves branches that stay saturated.
+
+    `queues` defaults to every `queue` element in `pipeline`. A branch is
+    saturated once its fill (the highest ratio of current level to limit over
+    buffers, bytes and time) stays at or above `threshold` for `hold`
+    consecutive samples. The `critical` branch starves when its fill is at or
+    below `starve_threshold` or it underran since the previous sample. With
+    the "throttle" policy, one buffer out of `throttle_keep` is kept.
+    """
+
+    def __init__(
+        self,
+        pipeline,
+        critical=None,
+        queues=None,
+        policy="observe",
+        interval=0.25,
+        threshold=0.9,
+        starve_threshold=0.1,
+        hold=4,
+        throttle_keep=2,
+    ):
+        if policy not in ("observe", "leaky", "throttle"):
+            raise ValueError(f"Unknown queue policy '{policy}'")
+
+        self.pipeline = pipeline
+        self.critical = critical
+        self.policy = policy
+        self.interval = interval
+        self.threshold = threshold
+        self.starve_threshold = starve_threshold
+        self.hold = hold
+        self.throttle_keep = throttle_keep
+
+        if queues is None:
+            queues = [
+                element
+                for element in iterate(pipeline.iterate_recurse())
+                if element.get_factory() and element.get_factory().get_name() == "queue"
+            ]
+        self.branches = {queue.get_name(): BranchStats(queue) for queue in queues}
+        for stats in self.branches.values():
+            # emitted from the streaming thread whenever the queue is full;
+            # once the queue is leaky, every overrun is a dropped buffer
+            stats.queue.connect("overrun", self.on_overrun, stats)
+            # emitted when the queue runs empty
+            stats.queue.connect("underrun", self.on_underrun, stats)
+        self.critical_underruns = 0
+
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.sample_loop, name="queue-monitor")
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        for name, stats in self.stats().items():
+            logger.info(f"Queue {name}: {stats}")
+
+    def stats(self):
+        return {name: stats.as_dict() for name, stats in self.branches.items()}
+
+    def on_overrun(self, queue, stats):
+        stats.overruns += 1
+        if stats.action == "leaky":
+            stats.drops += 1
+
+    def on_underrun(self, queue, stats):
+        stats.underruns += 1
+        if stats.name == self.critical:
+            self.critical_underruns += 1
+
+    def sample_loop(self):
+        while not self.stopping.wait(self.interval):
+            critical = self.branches.get(self.critical)
+            if critical is not None:
+                self.sample(critical)
+            starving = self.critical_starving(critical)
+            for stats in self.branches.values():
+                if stats is not critical:
+                    self.sample(stats, starving)
+
+    def critical_starving(self, critical):
+        if critical is None:
+            return False
+        underruns, self.critical_underruns = self.critical_underruns, 0
+        return underruns > 0 or critical.fill <= self.starve_threshold
+
+    def sample(self, stats, starving=False):
+        fill = 0.0
+        for level_property, max_property in LEVEL_PROPERTIES:
+            limit = stats.queue.get_property(max_property)
+            if limit:
+                fill = max(fill, stats.queue.get_property(level_property) / limit)
+
+        stats.samples += 1
+        stats.fill = fill
+        stats.fill_sum += fill
+        stats.max_fill = max(stats.max_fill, fill)
+        if fill < self.threshold:
+            stats.saturated_run = 0
+            return
+
+        stats.saturated_samples += 1
+        stats.saturated_run += 1
+        # a full queue next to a starving critical branch blocks the tee
+        if stats.saturated_run >= self.hold and starving and stats.action is None:
+            logger.warning(
+                f"Queue {stats.name} saturated for "
+                f"{stats.saturated_run * self.interval:.2f}s (fill {fill:.0%}) "
+                f"while {self.critical} starves"
+            )
+            self.relieve(stats)
+
+    def relieve(self, stats):
+        if stats.name == self.critical or stats.action is not None:
+            return
+        if self.policy == "observe":
+            # only reported once
+            stats.action = "observed"
+        elif self.policy == "leaky":
+            Gst.util_set_object_arg(stats.queue, "leaky", "downstream")
+            stats.action = "leaky"
+            logger.info(f"Queue {stats.name} switched to leaky=downstream")
+        elif self.policy == "throttle":
+            stats.queue.get_static_pad("src").add_probe(
+                Gst.PadProbeType.BUFFER, self.on_throttled_buffer, stats
+            )
+            stats.action = "throttle"
+            logger.info(
+                f"Queue {stats.name} throttled to 1/{self.throttle_keep} buffers"
+            )
+
+    def on_throttled_buffer(self, pad, info, stats):
+        stats.throttle_count += 1
+        if stats.throttle_count % self.throttle_keep:
+            stats.drops += 1
+            return Gst.PadProbeReturn.DROP
+        return Gst.PadProbeReturn.OK
@@ -0,0 +1,258 @@
+"""
+Persistent index of the element registry for fast capability lookups.
+
+bt06 walks the pad templates of a factory live. Answering "which elements
+accept audio/x-raw,format=S16LE and output video/x-raw" that way means
+loading every factory and intersecting the caps of all their templates.
+RegistryIndex snapshots every element factory (rank, klass, plugin and pad
+templates with their caps) into a JSON file once, and rebuilds it only when
+the set of plugins (file, size, mtime) or the GStreamer version changes.
+
+Lookups go through a map from media type (e.g. "audio/x-raw") to the
+templates that can handle it, so only a handful of caps are intersected per
+query and no element is instantiated.
+
+    python registry_index.py --sink audio/x-raw,format=S16LE --src video/x-raw
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+logger = logging.getLogger(__name__)
+
+INDEX_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "gst-registry-index.json",
+)
+
+DIRECTIONS = {Gst.PadDirection.SRC: "src", Gst.PadDirection.SINK: "sink"}
+PRESENCES = {
+    Gst.PadPresence.ALWAYS: "always",
+    Gst.PadPresence.SOMETIMES: "sometimes",
+    Gst.PadPresence.REQUEST: "request",
+}
+
+FactoryInfo = collections.namedtuple(
+    "FactoryInfo", ["name", "rank", "klass", "plugin", "templates"]
+)
+TemplateInfo = collections.namedtuple(
+    "TemplateInfo", ["name", "direction", "presence", "caps", "media_types"]
+)
+
+
+def registry_fingerprint():
+    """Changes whenever a plugin is added, removed or updated."""
+    digest = hashlib.sha1(Gst.version_string().encode())
+    plugins = Gst.Registry.get().get_plugin_list()
+    for plugin in sorted(plugins, key=lambda plugin: plugin.get_name()):
+        filename = plugin.get_filename() or ""
+        try:
+            stat = os.stat(filename)
+            identity = f"{stat.st_size}:{stat.st_mtime_ns}"
+        except OSError:
+            identity = plugin.get_version() or ""
+        digest.update(f"{plugin.get_name()}|{filename}|{identity}\n".encode())
+    return digest.hexdigest()
+
+
+def snapshot_factory(factory):
+    templates = []
+    for static in factory.get_static_pad_templates():
+        caps = static.get_caps()
+        if caps.is_any():
+            media_types = ["ANY"]
+        else:
+            media_types = sorted(
+                {caps.get_structure(i).get_name() for i in range(caps.get_size())}
+            )
+        templates.append(
+            {
+                "name": static.name_template,
+                "direction": DIRECTIONS.get(static.direction, "unknown"),
+                "presence": PRESENCES.get(static.presence, "unknown"),
+                "caps": caps.to_string(),
+                "media_types": media_types,
+            }
+        )
+    return {
+        "name": factory.get_name(),
+        "rank": factory.get_rank(),
+        "klass": factory.get_metadata("klass") or "",
+        "plugin": factory.get_plugin_name(),
+        "templates": templates,
+    }
+
+
+def build_index(path=INDEX_PATH):
+    """Snapshots the registry to `path` and returns the RegistryIndex."""
+    start = time.perf_counter()
+    factories = Gst.Registry.get().get_feature_list(Gst.ElementFactory)
+    data = {
+        "fingerprint": registry_fingerprint(),
+        "factories": [snapshot_factory(factory) for factory in factories],
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
+    logger.info(
+        f"Indexed {len(factories)} element factories "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    return RegistryIndex(data["factories"])
+
+
+def load_index(path=INDEX_PATH):
+    """Returns the index at `path`, rebuilt first if the registry changed."""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        if data["fingerprint"] == registry_fingerprint():
+            return RegistryIndex(data["factories"])
+        logger.info("Element registry changed, rebuilding the index")
+    except (OSError, ValueError, KeyError):
+        pass
+    return build_index(path)
+
+
+class RegistryIndex:
+    """Element factories by name, with templates indexed by media type."""
+
+    def __init__(self, factories):
+        self.factories = {}
+        # (direction, media type) -> [(factory name, template)]
+        self.by_media_type = collections.defaultdict(list)
+        self.parsed_caps = {}
+        for factory in factories:
+            templates = [TemplateInfo(**template) for template in factory["templates"]]
+            info = FactoryInfo(**{**factory, "templates": templates})
+            self.factories[info.name] = info
+            for template in templates:
+                for media_type in template.media_types:
+                    self.by_media_type[(template.direction, media_type)].append(
+                        (info.name, template)
+                    )
+
+    def caps(self, caps_string):
+        caps = self.parsed_caps.get(caps_string)
+        if caps is None:
+            caps = Gst.Caps.from_string(caps_string)
+            self.parsed_caps[caps_string] = caps
+        return caps
+
+    def media_types(self, caps):
+        if isinstance(caps, str):
+            caps = self.caps(caps)
+        return {caps.get_structure(i).get_name() for i in range(caps.get_size())}
+
+    def matching(self, direction, caps, any_caps=True):
+        """Names of the factories with a `direction` template that can
+        intersect `caps` (a string or Gst.Caps), ANY templates included
+        unless `any_caps` is False."""
+        if isinstance(caps, str):
+            caps = self.caps(caps)
+        media_types = self.media_types(caps)
+        if any_caps:
+            media_types.add("ANY")
+        names = set()
+        for media_type in media_types:
+            for name, template in self.by_media_type.get((direction, media_type), []):
+                if name not in names and caps.can_intersect(self.caps(template.caps)):
+                    names.add(name)
+        return names
+
+    def find(
+        self, sink_caps=None, src_caps=None, klass=None, min_rank=0, any_caps=True
+    ):
+        """Factories accepting `sink_caps` and producing `src_caps`, whose
+        klass contains every "/"-separated part of `klass`, best rank first.
+
+        When the sink and src caps have different media types, factories
+        that only match through ANY templates on both sides (queue, tee,
+        identity, ...) are left out, as they never convert between them.
+        `any_caps=False` ignores ANY templates altogether.
+        """
+        names = None
+        for direction, caps in (("sink", sink_caps), ("src", src_caps)):
+            if caps is not None:
+                matched = self.matching(direction, caps, any_caps)
+                names = matched if names is None else names & matched
+        if names is None:
+            names = set(self.factories)
+        elif (
+            any_caps
+            and sink_caps is not None
+            and src_caps is not None
+            and self.media_types(sink_caps).isdisjoint(self.media_types(src_caps))
+        ):
+            specific = self.matching("sink", sink_caps, False) | self.matching(
+                "src", src_caps, False
+            )
+            names &= specific
+
+        parts = klass.split("/") if klass else []
+        found = []
+        for name in names:
+            info = self.factories[name]
+            if info.rank >= min_rank and all(part in info.klass for part in parts):
+                found.append(info)
+        found.sort(key=lambda info: (-info.rank, info.name))
+        return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sink", help="caps the element must accept")
+    parser.add_argument("--src", help="caps the element must produce")
+    parser.add_argument("--klass", help="e.g. Converter/Video")
+    parser.add_argument("--min-rank", type=int, default=0)
+    parser.add_argument(
+        "--no-any", action="store_true", help="ignore templates with ANY caps"
+    )
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--index", default=INDEX_PATH)
+    args = parser.parse_args()
+
+    Gst.init(None)
+    start = time.perf_counter()
+    index = build_index(args.index) if args.rebuild else load_index(args.index)
+    logger.info(f"Index ready in {1000 * (time.perf_counter() - start):.1f} ms")
+
+    query = dict(
+        sink_caps=args.sink,
+        src_caps=args.src,
+        klass=args.klass,
+        min_rank=args.min_rank,
+        any_caps=not args.no_any,
+    )
+    found = index.find(**query)
+    # the first query parses the template caps it needs, later ones reuse them
+    start = time.perf_counter()
+    runs = 100
+    for _ in range(runs):
+        index.find(**query)
+    per_query = 1e6 * (time.perf_counter() - start) / runs
+
+    for info in found:
+        logger.info(f"{info.name:30s} rank {info.rank:4d}  {info.klass}")
+    logger.info(f"{len(found)} factories, {per_query:.0f} us per query")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    sys.exit(main())
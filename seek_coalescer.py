@@ -0,0 +1,152 @@
+"""
+Seek coalescing for scrubbing, as in the slider of
+bt05_gui_toolkit_integration.py.
+
+Sending a flushing seek on every `value-changed` event while the slider is
+dragged queues dozens of seeks, each flushing the previous one before it
+produced a frame. SeekCoalescer keeps at most one seek in flight: new
+targets replace the pending one, which is only sent once the pipeline posts
+ASYNC_DONE for the previous seek. While scrubbing, seeks are trick-mode
+keyframe seeks (no delta frames are decoded); the final seek on release is
+ACCURATE.
+
+It listens to `message::async-done` on the bus, so the bus needs a signal
+watch (`bus.add_signal_watch()`) and a running GLib main loop. Seeks that
+never complete with ASYNC_DONE (live or non-prerolling media, seeks that do
+not lose the state) are given up after `timeout_ms`, as are seeks in flight
+on an error or when the pipeline goes back to READY.
+"""
+
+import logging
+import statistics
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+gi.require_version("GLib", "2.0")
+from gi.repository import GLib, Gst
+
+logger = logging.getLogger(__name__)
+
+SCRUB_FLAGS = (
+    Gst.SeekFlags.FLUSH
+    | Gst.SeekFlags.KEY_UNIT
+    | Gst.SeekFlags.SNAP_NEAREST
+    | Gst.SeekFlags.TRICKMODE
+    | Gst.SeekFlags.TRICKMODE_KEY_UNITS
+)
+ACCURATE_FLAGS = Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE
+
+
+class SeekCoalescer:
+    """Sends the latest requested seek once the previous one completed."""
+
+    def __init__(self, pipeline, timeout_ms=500):
+        self.pipeline = pipeline
+        self.timeout_ms = timeout_ms
+        self.pending = None
+        self.in_flight = None
+        self.timer = None
+        self.requests = 0
+        self.timeouts = 0
+        self.latencies = []
+        bus = pipeline.get_bus()
+        bus.connect("message::async-done", self.on_async_done)
+        bus.connect("message::error", self.on_error)
+        bus.connect("message::state-changed", self.on_state_changed)
+
+    def scrub(self, position):
+        """Requests a fast keyframe seek to `position` (ns) while dragging."""
+        self.request(position, SCRUB_FLAGS)
+
+    def release(self, position):
+        """Requests the final, frame-accurate seek to `position` (ns)."""
+        self.request(position, ACCURATE_FLAGS)
+
+    def request(self, position, flags):
+        self.requests += 1
+        self.pending = (int(position), flags)
+        if self.in_flight is not None and self.in_flight[:2] == self.pending:
+            # already on its way
+            self.pending = None
+        elif self.in_flight is None:
+            self.send_pending()
+
+    def send_pending(self):
+        position, flags = self.pending
+        self.pending = None
+        # trick mode stays active until the next seek, so the accurate seek
+        # on release also brings playback back to every frame
+        event = Gst.Event.new_seek(
+            1.0,
+            Gst.Format.TIME,
+            flags,
+            Gst.SeekType.SET,
+            position,
+            Gst.SeekType.NONE,
+            -1,
+        )
+        self.in_flight = (position, flags, time.perf_counter())
+        if not self.pipeline.send_event(event):
+            logger.error(f"Seek to {position / Gst.SECOND:.3f}s failed")
+            self.in_flight = None
+            return
+        self.timer = GLib.timeout_add(self.timeout_ms, self.on_timeout)
+
+    def clear_in_flight(self):
+        if self.timer is not None:
+            GLib.source_remove(self.timer)
+            self.timer = None
+        self.in_flight = None
+
+    def on_timeout(self):
+        # no ASYNC_DONE came for the seek in flight, stop waiting for it
+        self.timer = None
+        if self.in_flight is not None:
+            position = self.in_flight[0]
+            logger.debug(
+                f"seek to {position / Gst.SECOND:.3f}s not done after "
+                f"{self.timeout_ms} ms, sending the next one"
+            )
+            self.timeouts += 1
+            self.in_flight = None
+            if self.pending is not None:
+                self.send_pending()
+        return False
+
+    def on_error(self, bus, msg):
+        self.clear_in_flight()
+
+    def on_state_changed(self, bus, msg):
+        if msg.src != self.pipeline:
+            return
+        old, new, pending = msg.parse_state_changed()
+        if new <= Gst.State.READY:
+            # going to READY flushes, nothing in flight will complete
+            self.clear_in_flight()
+            self.pending = None
+
+    def on_async_done(self, bus, msg):
+        if msg.src != self.pipeline or self.in_flight is None:
+            return
+        position, flags, start = self.in_flight
+        latency = time.perf_counter() - start
+        self.latencies.append(latency)
+        self.clear_in_flight()
+        kind = "accurate" if flags & Gst.SeekFlags.ACCURATE else "keyframe"
+        logger.debug(
+            f"{kind} seek to {position / Gst.SECOND:.3f}s took {1000 * latency:.1f} ms"
+        )
+        if self.pending is not None:
+            self.send_pending()
+
+    def stats(self):
+        latencies = self.latencies or [0.0]
+        return {
+            "requests": self.requests,
+            "seeks": len(self.latencies),
+            "timeouts": self.timeouts,
+            "median_latency_ms": 1000 * statistics.median(latencies),
+            "max_latency_ms": 1000 * max(latencies),
+        }
@@ -0,0 +1,228 @@
+"""
+Decode only the streams that are consumed.
+
+`Player.on_pad_added` in bt03_dynamic_pipelines.py links every pad that
+uridecodebin exposes, so every stream in the container is decoded even when
+only the video (or the first audio track) is used. StreamSelection declares
+the wanted streams up front and applies it in one of two ways:
+
+- `select_in_decodebin3()`: answers the stream collection of uridecodebin3 /
+  decodebin3 with a SELECT_STREAMS event, so unselected streams never get a
+  decoder at all.
+- `restrict_uridecodebin()`: for the classic uridecodebin used by bt03,
+  stops autoplugging of unwanted streams right after the demuxer (via
+  `autoplug-continue`) and only exposes the wanted raw caps.
+
+Run this file with a URI to compare CPU and wall-clock time of a video-only
+run with decoding every stream.
+"""
+
+import functools
+import logging
+import resource
+import sys
+import threading
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+from preroll_pool import build_decode_pipeline
+
+logger = logging.getLogger(__name__)
+
+RAW_CAPS = {
+    "video": "video/x-raw",
+    "audio": "audio/x-raw",
+    "text": "text/x-raw",
+}
+
+STREAM_TYPES = {
+    Gst.StreamType.VIDEO: "video",
+    Gst.StreamType.AUDIO: "audio",
+    Gst.StreamType.TEXT: "text",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def demuxer_factories():
+    """Every demuxer in the registry, listed once."""
+    return Gst.ElementFactory.list_get_elements(
+        Gst.ELEMENT_FACTORY_TYPE_DEMUXER, Gst.Rank.NONE
+    )
+
+
+def is_container(caps):
+    """True if some demuxer accepts `caps` (Matroska, MPEG-TS, M4A, ...)."""
+    return bool(
+        Gst.ElementFactory.list_filter(
+            demuxer_factories(), caps, Gst.PadDirection.SINK, False
+        )
+    )
+
+
+def caps_stream_kind(caps):
+    """Returns 'video', 'audio', 'text' or None for container caps."""
+    if is_container(caps):
+        return None
+    name = caps.get_structure(0).get_name()
+    if name.startswith("video/"):
+        return "video"
+    if name.startswith("audio/"):
+        return "audio"
+    if name.startswith(("text/", "subpicture/", "application/x-ssa")):
+        return "text"
+    return None
+
+
+class StreamSelection:
+    """How many streams of each kind to decode, in container order.
+
+    For example `StreamSelection(video=1)` is video only and
+    `StreamSelection(audio=1)` is the first audio track only.
+    """
+
+    def __init__(self, video=0, audio=0, text=0):
+        self.wanted = {"video": video, "audio": audio, "text": text}
+        self.lock = threading.Lock()
+        self.accepted = {kind: [] for kind in self.wanted}
+
+    def raw_caps(self):
+        """Caps covering the raw output of every wanted kind."""
+        kinds = [kind for kind, count in self.wanted.items() if count]
+        return Gst.Caps.from_string("; ".join(RAW_CAPS[kind] for kind in kinds))
+
+    def accept(self, kind, stream_id):
+        """True if the stream is (or becomes) one of the selected ones."""
+        with self.lock:
+            accepted = self.accepted[kind]
+            if stream_id in accepted:
+                return True
+            if len(accepted) < self.wanted[kind]:
+                accepted.append(stream_id)
+                return True
+            return False
+
+    def select_collection(self, collection):
+        """Returns the stream ids to select from a Gst.StreamCollection."""
+        counts = {kind: 0 for kind in self.wanted}
+        selected = []
+        for i in range(collection.get_size()):
+            stream = collection.get_stream(i)
+            for stream_type, kind in STREAM_TYPES.items():
+                if stream.get_stream_type() & stream_type:
+                    if counts[kind] < self.wanted[kind]:
+                        counts[kind] += 1
+                        selected.append(stream.get_stream_id())
+                    break
+        return selected
+
+    def select_in_decodebin3(self, pipeline, decodebin):
+        """Selects the streams of `decodebin` (uridecodebin3 or decodebin3)
+        as soon as it posts its stream collection."""
+        bus = pipeline.get_bus()
+        bus.enable_sync_message_emission()
+
+        def on_stream_collection(bus, msg):
+            if msg.src != decodebin and not msg.src.has_as_ancestor(decodebin):
+                return
+            collection = msg.parse_stream_collection()
+            selected = self.select_collection(collection)
+            logger.info(f"Selecting streams {selected}")
+            decodebin.send_event(Gst.Event.new_select_streams(selected))
+
+        bus.connect("sync-message::stream-collection", on_stream_collection)
+
+    def restrict_uridecodebin(self, uridecodebin):
+        """Keeps classic uridecodebin from decoding unwanted streams."""
+        uridecodebin.set_property("caps", self.raw_caps())
+        uridecodebin.set_property("expose-all-streams", False)
+
+        def on_autoplug_continue(bin, pad, caps):
+            kind = caps_stream_kind(caps)
+            if kind is None:
+                # container formats still need a demuxer
+                return True
+            stream_id = pad.get_stream_id()
+            if stream_id is None:
+                # typefind output before any demuxer, nothing to select yet
+                return True
+            # the stream id is the same for every pad along one stream, from
+            # the demuxer to the decoder, so this also lets it be decoded
+            return self.accept(kind, stream_id)
+
+        uridecodebin.connect("autoplug-continue", on_autoplug_continue)
+
+
+def build_selective_pipeline(uri, selection, video_sink="autovideosink"):
+    """uridecodebin3 decoding only the selected streams, video to
+    videoconvert ! <video_sink>, audio to audioconvert ! fakesink."""
+    pipeline = Gst.Pipeline.new(None)
+    source = Gst.ElementFactory.make("uridecodebin3", "source")
+    source.set_property("uri", uri)
+    pipeline.add(source)
+    selection.select_in_decodebin3(pipeline, source)
+
+    def on_pad_added(src, new_pad):
+        kind = caps_stream_kind(new_pad.query_caps(None))
+        if kind == "video":
+            description = f"videoconvert ! {video_sink}"
+        else:
+            description = "audioconvert ! fakesink"
+        branch = Gst.parse_bin_from_description(description, True)
+        pipeline.add(branch)
+        branch.sync_state_with_parent()
+        new_pad.link(branch.get_static_pad("sink"))
+
+    source.connect("pad-added", on_pad_added)
+    return pipeline
+
+
+def run_to_eos(pipeline):
+    """Plays as fast as possible, returns (wall seconds, CPU seconds)."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_start = usage.ru_utime + usage.ru_stime
+    start = time.perf_counter()
+    pipeline.set_state(Gst.State.PLAYING)
+    msg = pipeline.get_bus().timed_pop_filtered(
+        Gst.CLOCK_TIME_NONE, Gst.MessageType.ERROR | Gst.MessageType.EOS
+    )
+    wall = time.perf_counter() - start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    pipeline.set_state(Gst.State.NULL)
+    if msg.type == Gst.MessageType.ERROR:
+        err, debug_info = msg.parse_error()
+        logger.error(f"Error received from element {msg.src.get_name()}: {err.message}")
+    return wall, usage.ru_utime + usage.ru_stime - cpu_start
+
+
+def benchmark(uri):
+    runs = {
+        "all streams (bt03)": build_decode_pipeline(
+            uri, "fakesink sync=false", "fakesink sync=false"
+        ),
+        "video only (uridecodebin3)": build_selective_pipeline(
+            uri, StreamSelection(video=1), "fakesink sync=false"
+        ),
+    }
+
+    legacy = build_decode_pipeline(uri, "fakesink sync=false", "fakesink sync=false")
+    StreamSelection(video=1).restrict_uridecodebin(legacy.get_by_name("source"))
+    runs["video only (uridecodebin)"] = legacy
+
+    for label, pipeline in runs.items():
+        wall, cpu = run_to_eos(pipeline)
+        logger.info(f"{label}: wall {wall:.2f}s, CPU {cpu:.2f}s")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    Gst.init(sys.argv)
+    uri = "file:///app/videos/chime_2min.mp4"
+    if len(sys.argv) > 1:
+        uri = sys.argv[1]
+    benchmark(uri)
@@ -0,0 +1,108 @@
+"""
+Incremental, coalesced stream tag tracking for playbin, as used by
+bt05_gui_toolkit_integration.py.
+
+playbin emits `video-tags-changed` / `audio-tags-changed` / `text-tags-changed`
+from its streaming threads, once per tag event. Rebuilding the description
+of every stream for each of them keeps the UI thread busy with live sources
+that update tags constantly. StreamTagModel instead:
+
+- only records which stream changed (cheap, on the streaming thread),
+- schedules at most one refresh per `interval_ms` on the GLib main loop,
+- re-reads the tags of the changed streams only, and
+- calls `on_changed` only if the values shown for a stream really changed.
+"""
+
+import logging
+import threading
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import GLib, Gst
+
+logger = logging.getLogger(__name__)
+
+# per stream kind: (label, tag, getter) of the values that are shown
+FIELDS = {
+    "video": [("codec", Gst.TAG_VIDEO_CODEC, "get_string")],
+    "audio": [
+        ("codec", Gst.TAG_AUDIO_CODEC, "get_string"),
+        ("language", Gst.TAG_LANGUAGE_CODE, "get_string"),
+        ("bitrate", Gst.TAG_BITRATE, "get_uint"),
+    ],
+    "text": [("language", Gst.TAG_LANGUAGE_CODE, "get_string")],
+}
+
+
+def read_fields(kind, tags):
+    info = {}
+    for label, tag, getter in FIELDS[kind]:
+        ret, value = getattr(tags, getter)(tag)
+        if ret:
+            info[label] = value
+    return info
+
+
+class StreamTagModel:
+    """Cached {(kind, index): {label: value}} of the streams of `playbin`.
+
+    `on_changed(changed)` runs on the main loop with the set of (kind, index)
+    keys whose values changed or disappeared since the last call.
+    """
+
+    def __init__(self, playbin, on_changed, interval_ms=40):
+        self.playbin = playbin
+        self.on_changed = on_changed
+        self.interval_ms = interval_ms
+        self.streams = {}
+        self.lock = threading.Lock()
+        self.dirty = set()
+        self.scheduled = False
+        self.refreshes = 0
+        self.signals = 0
+        for kind in FIELDS:
+            playbin.connect(f"{kind}-tags-changed", self.on_tags_changed, kind)
+
+    def on_tags_changed(self, playbin, index, kind):
+        # streaming thread: remember the stream, refresh later from the
+        # main loop, once for the whole burst
+        with self.lock:
+            self.signals += 1
+            self.dirty.add((kind, index))
+            if self.scheduled:
+                return
+            self.scheduled = True
+        GLib.timeout_add(self.interval_ms, self.refresh)
+
+    def refresh(self):
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+            self.scheduled = False
+        self.refreshes += 1
+
+        counts = {kind: self.playbin.get_property(f"n-{kind}") for kind in FIELDS}
+        changed = set()
+        # streams that went away, e.g. after a new URI
+        for key in list(self.streams):
+            kind, index = key
+            if index >= counts[kind]:
+                del self.streams[key]
+                changed.add(key)
+
+        for key in dirty:
+            kind, index = key
+            if index >= counts[kind]:
+                continue
+            tags = self.playbin.emit(f"get-{kind}-tags", index)
+            info = read_fields(kind, tags) if tags else None
+            if self.streams.get(key) != info:
+                self.streams[key] = info
+                changed.add(key)
+
+        if changed:
+            self.on_changed(changed)
+        return GLib.SOURCE_REMOVE
+
+    def stats(self):
+        return {"signals": self.signals, "refreshes": self.refreshes}
@@ -0,0 +1,208 @@
+"""
+Hot-plugging of tee branches, on top of the tee pattern used in
+bt07_multithreading_and_pad_availability.py and
+bt08_short_cutting_the_pipeline.py.
+
+Branches are `queue`-fronted bins built from a launch description. Adding one
+requests a tee pad and links it while the pipeline keeps playing. Removing one
+waits in an IDLE probe until no buffer is in flight on that tee pad, unlinks
+it there, and tears the bin down off the streaming thread, so the other
+branches never see a half-linked tee.
+
+Run this file to measure the stall on an existing branch while another branch
+is added and removed.
+"""
+
+import collections
+import logging
+import statistics
+import sys
+import threading
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+logger = logging.getLogger(__name__)
+
+TeeBranch = collections.namedtuple("TeeBranch", ["name", "bin", "tee_pad"])
+
+
+class TeeBranches:
+    """Adds and removes branches of a tee in a running pipeline."""
+
+    def __init__(self, pipeline, tee):
+        self.pipeline = pipeline
+        self.tee = tee
+        self.tee_src_pad_template = tee.get_pad_template("src_%u")
+        self.branches = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, description):
+        """Builds `queue ! <description>` as a bin and links it to the tee."""
+        with self.lock:
+            if name in self.branches:
+                raise ValueError(f"Branch '{name}' already exists")
+
+            branch_bin = Gst.parse_bin_from_description(
+                f"queue name={name}_queue ! {description}", True
+            )
+            branch_bin.set_name(name)
+            self.pipeline.add(branch_bin)
+            # bring the branch up to the pipeline state before data arrives
+            branch_bin.sync_state_with_parent()
+
+            tee_pad = self.tee.request_pad(self.tee_src_pad_template, None, None)
+            logger.info(f"Obtained request pad {tee_pad.get_name()} for {name}")
+            ret = tee_pad.link(branch_bin.get_static_pad("sink"))
+            if ret != Gst.PadLinkReturn.OK:
+                self.tee.release_request_pad(tee_pad)
+                branch_bin.set_state(Gst.State.NULL)
+                self.pipeline.remove(branch_bin)
+                raise RuntimeError(f"Could not link branch '{name}': {ret}")
+
+            branch = TeeBranch(name, branch_bin, tee_pad)
+            self.branches[name] = branch
+            return branch
+
+    def remove(self, name, drain=False, on_removed=None):
+        """Unlinks the branch `name` and disposes of it.
+
+        The unlink happens in an IDLE probe on the tee pad. With `drain`, EOS
+        is sent into the branch first and the bin is only shut down once its
+        sinks got it, so recorders can finalize their files. `on_removed` is
+        called with the branch name from a helper thread when done.
+        """
+        with self.lock:
+            branch = self.branches.pop(name)
+        branch.tee_pad.add_probe(
+            Gst.PadProbeType.IDLE, self.on_tee_pad_idle, branch, drain, on_removed
+        )
+
+    def on_tee_pad_idle(self, pad, info, branch, drain, on_removed):
+        sink_pad = branch.bin.get_static_pad("sink")
+        pad.unlink(sink_pad)
+
+        if drain:
+            sinks = list(iterate(branch.bin.iterate_sinks()))
+            remaining = {"count": len(sinks)}
+            for sink in sinks:
+                sink.get_static_pad("sink").add_probe(
+                    Gst.PadProbeType.EVENT_DOWNSTREAM,
+                    self.on_branch_eos,
+                    branch,
+                    remaining,
+                    on_removed,
+                )
+            sink_pad.send_event(Gst.Event.new_eos())
+        else:
+            self.teardown_later(branch, on_removed)
+        return Gst.PadProbeReturn.REMOVE
+
+    def on_branch_eos(self, pad, info, branch, remaining, on_removed):
+        if info.get_event().type != Gst.EventType.EOS:
+            return Gst.PadProbeReturn.OK
+        with self.lock:
+            remaining["count"] -= 1
+            done = remaining["count"] == 0
+        if done:
+            self.teardown_later(branch, on_removed)
+        return Gst.PadProbeReturn.REMOVE
+
+    def teardown_later(self, branch, on_removed):
+        # state changes must not happen on the streaming thread
+        thread = threading.Thread(
+            target=self.teardown, args=(branch, on_removed), daemon=True
+        )
+        thread.start()
+
+    def teardown(self, branch, on_removed):
+        branch.bin.set_state(Gst.State.NULL)
+        self.pipeline.remove(branch.bin)
+        self.tee.release_request_pad(branch.tee_pad)
+        logger.info(f"Removed branch {branch.name}")
+        if on_removed is not None:
+            on_removed(branch.name)
+
+
+def iterate(iterator):
+    """Yields the items of a Gst.Iterator."""
+    while True:
+        ret, item = iterator.next()
+        if ret == Gst.IteratorResult.RESYNC:
+            iterator.resync()
+            continue
+        if ret != Gst.IteratorResult.OK:
+            break
+        yield item
+
+
+def measure_stall(cycles=5, buffer_ms=10, settle=0.5):
+    """Logs the largest buffer gap on a running branch around hot-plugging.
+
+    A live audiotestsrc sends one buffer every `buffer_ms` to an existing
+    `queue ! fakesink` branch; a pad probe records the arrival times. Any gap
+    well above `buffer_ms` while a branch is added or removed is a stall.
+    """
+    samples = 44100 * buffer_ms // 1000
+    pipeline = Gst.parse_launch(
+        f"audiotestsrc is-live=true samplesperbuffer={samples} ! tee name=tee "
+        "tee. ! queue ! fakesink name=main sync=true"
+    )
+    tee = pipeline.get_by_name("tee")
+    arrivals = []
+
+    def on_buffer(pad, info):
+        arrivals.append(time.perf_counter())
+        return Gst.PadProbeReturn.OK
+
+    main_pad = pipeline.get_by_name("main").get_static_pad("sink")
+    main_pad.add_probe(Gst.PadProbeType.BUFFER, on_buffer)
+    branches = TeeBranches(pipeline, tee)
+    pipeline.set_state(Gst.State.PLAYING)
+    time.sleep(settle)
+
+    def max_gap_ms(start, end):
+        times = [t for t in arrivals if start <= t <= end]
+        gaps = [b - a for a, b in zip(times, times[1:])]
+        return 1000 * max(gaps) if gaps else float("nan")
+
+    baseline_start = time.perf_counter()
+    time.sleep(settle)
+    baseline = max_gap_ms(baseline_start, time.perf_counter())
+
+    add_gaps, remove_gaps = [], []
+    for i in range(cycles):
+        removed = threading.Event()
+        start = time.perf_counter()
+        branches.add(f"extra{i}", "audioconvert ! fakesink sync=true")
+        time.sleep(settle)
+        add_gaps.append(max_gap_ms(start, time.perf_counter()))
+
+        start = time.perf_counter()
+        branches.remove(f"extra{i}", on_removed=lambda name: removed.set())
+        removed.wait(5)
+        time.sleep(settle)
+        remove_gaps.append(max_gap_ms(start, time.perf_counter()))
+
+    pipeline.set_state(Gst.State.NULL)
+    logger.info(f"Nominal buffer interval: {buffer_ms} ms")
+    logger.info(f"Max gap without hot-plugging: {baseline:.1f} ms")
+    logger.info(
+        f"Max gap while adding: {max(add_gaps):.1f} ms "
+        f"(median {statistics.median(add_gaps):.1f} ms)"
+    )
+    logger.info(
+        f"Max gap while removing: {max(remove_gaps):.1f} ms "
+        f"(median {statistics.median(remove_gaps):.1f} ms)"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.DEBUG, format="[%(name)s] [%(levelname)s] - %(message)s"
+    )
+    Gst.init(sys.argv)
+    measure_stall()